@@ -11,15 +11,15 @@
 #                                                          #
 # hprose/__init__.py                                       #
 #                                                          #
-# hprose for python 3.0+                                   #
+# hprose for python 3.7+                                   #
 #                                                          #
-# LastModified: Mar 8, 2015                                #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
 
 from hprose.common import HproseResultMode, HproseException
-from hprose.io import HproseTags, HproseClassManager, HproseRawReader, HproseReader, HproseWriter, HproseFormatter
+from hprose.io import HproseTags, HproseClassManager, HproseCodecManager, HproseRawReader, HproseReader, HproseBufferReader, HproseLazyReader, HproseLazyList, HproseLazyMap, HproseIncrementalReader, HproseWriter, HproseIterativeReader, HproseIterativeWriter, HproseCanonicalWriter, HproseFormatter
 from hprose.client import HproseClient
 from hprose.server import HproseService
 from hprose.httpclient import HproseHttpClient
@@ -28,12 +28,22 @@ from hprose.httpserver import HproseHttpService, HproseHttpServer, UrlMapMiddlew
 ResultMode = HproseResultMode
 Tags = HproseTags
 ClassManager = HproseClassManager
+CodecManager = HproseCodecManager
 RawReader = HproseRawReader
 Reader = HproseReader
+BufferReader = HproseBufferReader
+LazyReader = HproseLazyReader
+LazyList = HproseLazyList
+LazyMap = HproseLazyMap
+IncrementalReader = HproseIncrementalReader
+IterativeReader = HproseIterativeReader
 Writer = HproseWriter
+IterativeWriter = HproseIterativeWriter
+CanonicalWriter = HproseCanonicalWriter
 Formatter = HproseFormatter
 serialize = Formatter.serialize
 unserialize = Formatter.unserialize
+digest = Formatter.digest
 Client = HproseClient
 Service = HproseService
 HttpClient = HproseHttpClient
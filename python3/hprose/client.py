@@ -11,16 +11,16 @@
 #                                                          #
 # hprose/client.py                                         #
 #                                                          #
-# hprose client for python 3.0+                            #
+# hprose client for python 3.7+                            #
 #                                                          #
-# LastModified: Dec 2, 2016                                #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
 
 import threading
 from sys import modules
-from hprose.io import BytesIO, HproseTags, HproseWriter, HproseReader
+from hprose.io import BytesIO, HproseTags, HproseWriter, HproseBufferReader, HproseLazyReader
 from hprose.common import HproseResultMode, HproseException
 
 class _Method(object):
@@ -144,7 +144,6 @@ class HproseClient(object):
             if byref: writer.writeBoolean(True)
         stream.write(HproseTags.TagEnd)
         data = stream.getvalue()
-        stream.close()
         for _filter in self.__filters:
             data = _filter.outputFilter(data, self)
         return data
@@ -158,38 +157,39 @@ class HproseClient(object):
             return data
         if resultMode == HproseResultMode.Raw:
             return data[:-1]
-        stream = BytesIO(data)
-        reader = HproseReader(stream)
+        reader = HproseBufferReader(data)
         result = None
-        try:
-            error = None
-            while True:
-                tag = stream.read(1)
-                if tag == HproseTags.TagEnd:
-                    break
-                elif tag == HproseTags.TagResult:
-                    if resultMode == HproseResultMode.Normal:
-                        reader.reset()
-                        result = reader.unserialize()
-                    else:
-                        s = reader.readRaw()
-                        result = s.getvalue()
-                        s.close()
-                elif tag == HproseTags.TagArgument:
-                    reader.reset()
-                    a = reader.readList()
-                    if isinstance(args, list):
-                        for i in range(len(args)):
-                            args[i] = a[i]
-                elif tag == HproseTags.TagError:
+        error = None
+        while True:
+            tag = reader.read(1)
+            if tag == HproseTags.TagEnd:
+                break
+            elif tag == HproseTags.TagResult:
+                if resultMode == HproseResultMode.Normal:
                     reader.reset()
-                    error = reader.readString()
+                    result = reader.unserialize()
+                elif resultMode == HproseResultMode.Lazy:
+                    lazy = HproseLazyReader(reader.data)
+                    lazy.pos = reader.pos
+                    result = lazy.unserialize()
+                    reader.pos = lazy.pos
                 else:
-                    raise HproseException("Wrong Response: \r\n%s" % str(data, 'utf-8'))
-            if error != None:
-                raise HproseException(error)
-        finally:
-            stream.close()
+                    s = reader.readRaw()
+                    result = s.getvalue()
+                    s.close()
+            elif tag == HproseTags.TagArgument:
+                reader.reset()
+                a = reader.readList()
+                if isinstance(args, list):
+                    for i in range(len(args)):
+                        args[i] = a[i]
+            elif tag == HproseTags.TagError:
+                reader.reset()
+                error = reader.readString()
+            else:
+                raise HproseException("Wrong Response: \r\n%s" % str(data, 'utf-8'))
+        if error != None:
+            raise HproseException(error)
         return result
 
     def __invoke(self, name, args, byref, resultMode, simple):
@@ -11,9 +11,9 @@
 #                                                          #
 # hprose/common.py                                         #
 #                                                          #
-# hprose common for python 3.0+                            #
+# hprose common for python 3.7+                            #
 #                                                          #
-# LastModified: Apr 12, 2014                               #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
@@ -23,6 +23,7 @@ class HproseResultMode:
     Serialized = 1
     Raw = 2
     RawWithEndTag = 3
+    Lazy = 4
 
 class HproseException(Exception):
     pass
@@ -11,9 +11,9 @@
 #                                                          #
 # hprose/httpclient.py                                     #
 #                                                          #
-# hprose httpclient for python 3.0+                        #
+# hprose httpclient for python 3.7+                        #
 #                                                          #
-# LastModified: Dec 25, 2018                               #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
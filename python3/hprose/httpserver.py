@@ -11,9 +11,9 @@
 #                                                          #
 # hprose/httpserver.py                                     #
 #                                                          #
-# hprose httpserver for python 3.0+                        #
+# hprose httpserver for python 3.7+                        #
 #                                                          #
-# LastModified: Mar 8, 2015                                #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
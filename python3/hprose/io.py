@@ -11,22 +11,36 @@
 #                                                          #
 # hprose/io.py                                             #
 #                                                          #
-# hprose io for python 3.0+                                #
+# hprose io for python 3.7+                                #
 #                                                          #
-# LastModified: Mar 8, 2015                                #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
 
 import datetime
+import re
+from collections.abc import Iterable, Iterator, Mapping, Sequence, Sized
 from io import BytesIO
 from fpconst import NaN, PosInf, NegInf, isInf, isNaN, isPosInf
+from functools import partial
+from hashlib import blake2b
 from inspect import isclass
-from sys import modules
+from itertools import chain
+from sys import modules, intern
+from operator import attrgetter
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
 from threading import RLock
+from types import GeneratorType, MemberDescriptorType
 from uuid import UUID
 from hprose.common import HproseException
 import decimal
+from dataclasses import fields as _dataclassFields, is_dataclass as _isDataclass
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 ZERO = datetime.timedelta(0)
 
@@ -82,42 +96,60 @@ _classCache1 = {}
 _classCache2 = {}
 _classCacheLock = RLock()
 
-def _get_class(name):
-    name = name.split('.')
-    if len(name) == 1:
-        return getattr(modules['__main__'], name[0], None)
-    clsname = name.pop()
-    modname = '.'.join(name)
-    if modname in modules:
-        return getattr(modules[modname], clsname, None)
-    return None
+_moduleIndex = {}
+_moduleIndexSize = -1
+_classMisses = {}
+
+def _indexModules():
+    global _moduleIndex, _moduleIndexSize
+    size = len(modules)
+    if size == _moduleIndexSize: return
+    index = {}
+    for modname in list(modules):
+        index.setdefault(modname.replace('.', '_'), []).append(modname)
+    _moduleIndex = index
+    _moduleIndexSize = size
 
-def _get_class2(name, ps, i, c):
-    if i < len(ps):
-        p = ps[i]
-        name = name[:p] + c + name[p + 1:]
-        cls = _get_class2(name, ps, i + 1, '.')
-        if (i + 1 < len(ps)) and (cls == None):
-            cls = _get_class2(name, ps, i + 1, '_')
-        return cls
-    return _get_class(name)
-
-def _get_class_by_alias(name):
+def _get_class_by_alias(name, missing = None):
     cls = getattr(modules['__main__'], name, None)
-    if not isclass(cls):
-        ps = []
-        p = name.find('_')
-        while p > -1:
-            ps.append(p)
-            p = name.find('_', p + 1)
-        cls = _get_class2(name, ps, 0, '.')
-        if  cls == None:
-            cls = _get_class2(name, ps, 0, '_')
-    if cls == None:
-        cls = type(name, (), {})
-        cls.__module__ = '__main__'
-        setattr(modules['__main__'], name, cls)
-    return cls
+    if isclass(cls) and cls is not missing: return cls
+    _indexModules()
+    found = None
+    p = name.find('_')
+    while p > -1:
+        clsname = name[p + 1:]
+        for modname in _moduleIndex.get(name[:p], ()):
+            cls = getattr(modules.get(modname), clsname, None)
+            if isclass(cls) and cls is not missing:
+                fullname = modname + '.' + clsname
+                if found == None or fullname < found[0]:
+                    found = (fullname, cls)
+        p = name.find('_', p + 1)
+    if found == None: return None
+    return found[1]
+
+class HproseRecord(object):
+    __slots__ = ()
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join(['%s=%r' % (name, getattr(self, name, None))
+                                      for name in self.__slots__]))
+
+_recordClasses = {}
+
+def _getRecordClass(alias, fields):
+    key = (alias, fields)
+    if key in _recordClasses:
+        return _recordClasses[key]
+    if ((len(set(fields)) == len(fields)) and
+        all([name.isidentifier() and not name.startswith('__') for name in fields])):
+        _class = type(alias, (HproseRecord,), {'__slots__': fields})
+    else:
+        _class = type(alias, (), {})
+    _class.__module__ = '__main__'
+    _recordClasses[key] = _class
+    HproseClassManager.register(_class, alias)
+    return _class
 
 class HproseClassManager:
     def register(_class, alias):
@@ -125,18 +157,46 @@ class HproseClassManager:
         try:
             _classCache1[_class] = alias
             _classCache2[alias] = _class
+            _classMisses.pop(alias, None)
+            _classHeaderCache.clear()
         finally:
             _classCacheLock.release()
     register = staticmethod(register)
 
-    def getClass(alias):
-        if alias in _classCache2:
-            return _classCache2[alias]
-        _class = _get_class_by_alias(alias)
-        HproseClassManager.register(_class, alias)
+    def getClass(alias, fields = None):
+        _class = _classCache2.get(alias)
+        misses = _classMisses.get(alias)
+        if (_class != None) and (misses == None):
+            return _class
+        if (_class == None) or (misses != len(modules)):
+            found = _get_class_by_alias(alias, _class)
+            if found != None:
+                HproseClassManager.register(found, alias)
+                return found
+        if fields != None:
+            _class = _getRecordClass(alias, fields)
+        elif _class == None:
+            _class = type(alias, (), {})
+            _class.__module__ = '__main__'
+            setattr(modules['__main__'], alias, _class)
+            HproseClassManager.register(_class, alias)
+        _classMisses[alias] = len(modules)
         return _class
     getClass = staticmethod(getClass)
 
+    def warmup(*items):
+        for item in items:
+            if isinstance(item, str):
+                HproseClassManager.getClass(item)
+            elif isclass(item):
+                HproseClassManager.getClassAlias(item)
+            else:
+                for _class in list(vars(item).values()):
+                    if isclass(_class) and _class.__module__ == item.__name__:
+                        HproseClassManager.getClassAlias(_class)
+        _indexModules()
+    warmup = staticmethod(warmup)
+
     def getClassAlias(_class):
         if _class in _classCache1:
             return _classCache1[_class]
@@ -162,9 +222,75 @@ def _readint(stream, char):
     if s == b'': return 0
     return int(s, 10)
 
+_guidFormat = re.compile(rb'\{[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}\}')
+
+def _readguid(s):
+    if _guidFormat.fullmatch(s) == None: raise HproseException('Bad guid format')
+    return UUID(int = int(s[1:37].replace(b'-', b''), 16))
+
+_utf8Trailing = bytes(range(0x80, 0xC0))
+_utf8Astral = bytes(range(0xF0, 0xF8))
+
+def _utf16length(b):
+    return len(b.translate(None, _utf8Trailing)) + len(b) - len(b.translate(None, _utf8Astral))
+
+def _readstring(stream, count):
+    s = stream.read(count)
+    if len(s) == count and s.isascii():
+        stream.read(1)
+        return s
+    a = [s]
+    count -= _utf16length(s)
+    while count > 0:
+        s = stream.read(count)
+        if s == b'': raise HproseException('No byte found in stream')
+        a.append(s)
+        count -= _utf16length(s)
+    c = stream.read(1)
+    while c != b'' and (c[0] & 0xC0) == 0x80:
+        a.append(c)
+        c = stream.read(1)
+    return b''.join(a)
+
+def _indexraw(buf, pos):
+    tag = buf[pos:pos + 1]
+    if ((tag != HproseTags.TagList) and
+        (tag != HproseTags.TagMap)):
+        if tag == b'': raise HproseException('No byte found in stream')
+        raise HproseException(
+            "Tag '%s%s' expected, but '%s' found in stream" %
+            (str(HproseTags.TagList, 'utf-8'), str(HproseTags.TagMap, 'utf-8'),
+             str(tag, 'utf-8')))
+    i = buf.index(HproseTags.TagOpenbrace, pos + 1)
+    count = int(buf[pos + 1:i] or b'0', 10)
+    if tag == HproseTags.TagMap: count *= 2
+    index = []
+    pos = i + 1
+    for _ in range(count):
+        index.append(pos)
+        pos = _skipraw(buf, pos)
+    tag = buf[pos:pos + 1]
+    if tag != HproseTags.TagClosebrace:
+        if tag == b'': raise HproseException('No byte found in stream')
+        raise HproseException(
+            "Tag '%s' expected, but '%s' found in stream" %
+            (str(HproseTags.TagClosebrace, 'utf-8'), str(tag, 'utf-8')))
+    index.append(pos)
+    return (index, pos + 1)
+
 class HproseRawReader(object):
     def __init__(self, stream):
         self.stream = stream
+    def readIndex(self):
+        stream = self.stream
+        if hasattr(stream, 'getvalue'):
+            data = stream.getvalue()
+            (index, pos) = _indexraw(data, stream.tell())
+            stream.seek(pos)
+        else:
+            data = self.readRaw().getvalue()
+            (index, pos) = _indexraw(data, 0)
+        return (data, index)
     def unexpectedTag(self, tag, expectTags = None):
         if tag == b'':
             raise HproseException('No byte found in stream')
@@ -261,22 +387,8 @@ class HproseRawReader(object):
             l = 0
         else:
             l = int(l, 10)
-        s = []
-        i = 0
-        while i < l:
-            c = self.stream.read(1)
-            s.append(c)
-            a = ord(c)
-            if (a & 0xE0) == 0xC0:
-                s.append(self.stream.read(1))
-            elif (a & 0xF0) == 0xE0:
-                s.append(self.stream.read(2))
-            elif (a & 0xF8) == 0xF0:
-                s.append(self.stream.read(3))
-                i += 1
-            i += 1
-        s.append(self.stream.read(1))
-        ostream.write(b''.join(s))
+        ostream.write(_readstring(self.stream, l))
+        ostream.write(HproseTags.TagQuote)
     def __readGuidRaw(self, ostream):
         ostream.write(self.stream.read(38))
     def __readComplexRaw(self, ostream):
@@ -288,9 +400,30 @@ class HproseRawReader(object):
             tag = self.stream.read(1)
         ostream.write(tag)
 
+_internTable = {}
+_internTableSize = 65536
+_internLength = 64
+
+def _intern(s):
+    if len(s) > _internLength: return s
+    interned = _internTable.get(s)
+    if interned == None:
+        if len(_internTable) >= _internTableSize: return s
+        interned = _internTable[s] = intern(s)
+    return interned
+
+_leafTypes = frozenset([str, bytes, bytearray, memoryview, UUID,
+                        datetime.date, datetime.datetime, datetime.time])
+_scalarTypes = _leafTypes | frozenset([type(None), bool, int, float, decimal.Decimal])
+_unretained = object()
+
 class FakeReaderRefer:
     def set(self, val):
         pass
+    def reserve(self):
+        return -1
+    def update(self, index, val):
+        pass
     def read(self, index):
         raise HproseException(
                 "Unexpected serialize tag '%s' in stream" %
@@ -303,63 +436,263 @@ class RealReaderRefer:
         self.ref = []
     def set(self, val):
         self.ref.append(val)
+    def reserve(self):
+        self.ref.append(None)
+        return len(self.ref) - 1
+    def update(self, index, val):
+        self.ref[index] = val
     def read(self, index):
         return self.ref[index]
     def reset(self):
         del self.ref[:]
 
+class ContainerReaderRefer(RealReaderRefer):
+    def set(self, val):
+        self.ref.append(_unretained if type(val) in _leafTypes else val)
+    def read(self, index):
+        val = self.ref[index]
+        if val is _unretained:
+            raise HproseException('Reference %d is not retained' % index)
+        return val
+
+class BoundedReaderRefer(RealReaderRefer):
+    def __init__(self, maxsize = 65536):
+        super(BoundedReaderRefer, self).__init__()
+        self.maxsize = maxsize
+    def set(self, val):
+        if len(self.ref) < self.maxsize: self.ref.append(val)
+    def reserve(self):
+        if len(self.ref) < self.maxsize:
+            return super(BoundedReaderRefer, self).reserve()
+        return -1
+    def update(self, index, val):
+        if index >= 0: self.ref[index] = val
+    def read(self, index):
+        if index >= len(self.ref):
+            raise HproseException('Reference %d is not retained' % index)
+        return self.ref[index]
+
+def _const(value):
+    return lambda reader: value
+
+def _readClassAndObject(reader):
+    reader.readClassWithoutTag()
+    return reader.readObject()
+
+def _readError(reader):
+    raise HproseException(reader.readString())
+
+_digitTags = tuple(bytes((c,)) for c in range(48, 58))
+
+_unserializers = dict((tag, _const(int(tag, 10))) for tag in _digitTags)
+_unserializers.update({
+    HproseTags.TagInteger: 'readIntegerWithoutTag',
+    HproseTags.TagLong: 'readLongWithoutTag',
+    HproseTags.TagDouble: 'readDoubleWithoutTag',
+    HproseTags.TagNull: _const(None),
+    HproseTags.TagEmpty: _const(''),
+    HproseTags.TagTrue: _const(True),
+    HproseTags.TagFalse: _const(False),
+    HproseTags.TagNaN: _const(NaN),
+    HproseTags.TagInfinity: 'readInfinityWithoutTag',
+    HproseTags.TagDate: 'readDateWithoutTag',
+    HproseTags.TagTime: 'readTimeWithoutTag',
+    HproseTags.TagBytes: 'readBytesWithoutTag',
+    HproseTags.TagUTF8Char: 'readUTF8CharWithoutTag',
+    HproseTags.TagString: 'readStringWithoutTag',
+    HproseTags.TagGuid: 'readGuidWithoutTag',
+    HproseTags.TagList: 'readListWithoutTag',
+    HproseTags.TagMap: 'readMapWithoutTag',
+    HproseTags.TagClass: _readClassAndObject,
+    HproseTags.TagObject: 'readObjectWithoutTag',
+    HproseTags.TagRef: 'readRefWithoutTag',
+    HproseTags.TagError: _readError,
+})
+
+def _select(*tags):
+    return dict((tag, _unserializers[tag]) for tag in tags)
+
+_doubleUnserializers = dict((tag, _const(float(tag))) for tag in _digitTags)
+_doubleUnserializers.update({
+    HproseTags.TagInteger: 'readDoubleWithoutTag',
+    HproseTags.TagLong: 'readDoubleWithoutTag',
+    HproseTags.TagDouble: 'readDoubleWithoutTag',
+    HproseTags.TagNaN: _unserializers[HproseTags.TagNaN],
+    HproseTags.TagInfinity: 'readInfinityWithoutTag',
+})
+
+_bytesUnserializers = _select(HproseTags.TagNull,
+                              HproseTags.TagRef,
+                              HproseTags.TagBytes)
+_bytesUnserializers[HproseTags.TagEmpty] = _const(b'')
+
+_typedUnserializers = {
+    'Integer': _select(HproseTags.TagInteger,
+                       HproseTags.TagLong, *_digitTags),
+    'Double': _doubleUnserializers,
+    'Date': _select(HproseTags.TagNull,
+                    HproseTags.TagRef,
+                    HproseTags.TagDate),
+    'Time': _select(HproseTags.TagNull,
+                    HproseTags.TagRef,
+                    HproseTags.TagTime),
+    'Bytes': _bytesUnserializers,
+    'String': _select(HproseTags.TagNull,
+                      HproseTags.TagEmpty,
+                      HproseTags.TagUTF8Char,
+                      HproseTags.TagRef,
+                      HproseTags.TagString),
+    'Guid': _select(HproseTags.TagNull,
+                    HproseTags.TagRef,
+                    HproseTags.TagGuid),
+    'List': _select(HproseTags.TagNull,
+                    HproseTags.TagRef,
+                    HproseTags.TagList),
+    'NDArray': _select(HproseTags.TagNull,
+                       HproseTags.TagRef,
+                       HproseTags.TagList,
+                       HproseTags.TagBytes),
+    'Map': _select(HproseTags.TagNull,
+                   HproseTags.TagRef,
+                   HproseTags.TagMap),
+    'Object': _select(HproseTags.TagNull,
+                      HproseTags.TagRef,
+                      HproseTags.TagObject,
+                      HproseTags.TagClass),
+}
+
+_unserializerCache = {}
+
+def _resolveUnserializers(cls, handlers):
+    return dict((tag, getattr(cls, handler) if isinstance(handler, str) else handler)
+                for tag, handler in handlers.items())
+
+def _getUnserializers(cls):
+    unserializers = _unserializerCache.get(cls)
+    if unserializers == None:
+        unserializers = (_resolveUnserializers(cls, cls.unserializers),
+                         dict((name, _resolveUnserializers(cls, handlers))
+                              for name, handlers in cls.typedUnserializers.items()))
+        unserializers = _unserializerCache.setdefault(cls, unserializers)
+    return unserializers
+
+def _isNamedTuple(cls):
+    return issubclass(cls, tuple) and hasattr(cls, '_fields')
+
+def _isDataclassType(cls):
+    return isclass(cls) and _isDataclass(cls)
+
+def _slotNames(cls):
+    names = []
+    for base in reversed(cls.__mro__):
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, str): slots = (slots,)
+        for name in slots:
+            if name in ('__dict__', '__weakref__'): continue
+            if name.startswith('__') and not name.endswith('__'):
+                name = '_%s%s' % (base.__name__.lstrip('_'), name)
+            if name not in names: names.append(name)
+    return tuple(names)
+
+def _getObjectFields(cls):
+    if _isNamedTuple(cls):
+        return tuple(cls._fields)
+    if _isDataclassType(cls):
+        return tuple(field.name for field in _dataclassFields(cls))
+    if cls.__dictoffset__ == 0 and any('__slots__' in base.__dict__ for base in cls.__mro__):
+        return _slotNames(cls)
+    return None
+
+_decodePlanCache = {}
+
+def _isDataDescriptor(cls, name):
+    return hasattr(type(getattr(cls, name, None)), '__set__')
+
+def _attrSetter(name):
+    def setter(obj, value):
+        setattr(obj, name, value)
+    return setter
+
+def _makeDecodePlan(cls, fields):
+    if _isNamedTuple(cls):
+        return (None, None)
+    if _getObjectFields(cls) == None:
+        new = cls
+    else:
+        new = partial(cls.__new__, cls)
+    if (cls.__setattr__ is object.__setattr__) or _isDataclassType(cls):
+        if cls.__dictoffset__ != 0 and not any(_isDataDescriptor(cls, name) for name in fields):
+            return (new, None)
+        if all(type(getattr(cls, name, None)) is MemberDescriptorType for name in fields):
+            return (new, tuple(getattr(cls, name).__set__ for name in fields))
+    return (new, tuple(_attrSetter(name) for name in fields))
+
+def _getDecodePlan(cls, fields):
+    key = (cls, fields)
+    if key not in _decodePlanCache:
+        _decodePlanCache.setdefault(key, _makeDecodePlan(cls, fields))
+    return _decodePlanCache[key]
+
+_codecEncoders = {}
+_codecDecoders = {}
+
+class _CodecDecoder(object):
+    def __init__(self, decode, fields, expected):
+        self.decode = decode
+        self.fields = fields
+        if fields == expected:
+            self._make = self.__positional
+    def __positional(self, values):
+        return self.decode(*values)
+    def _make(self, values):
+        return self.decode(**dict(zip(self.fields, values)))
+
+class _NamedTupleDecoder(object):
+    def __init__(self, cls, fields):
+        self.cls = cls
+        self.fields = fields
+        self.defaults = dict.fromkeys(cls._fields)
+        self.defaults.update(cls._field_defaults)
+    def _make(self, values):
+        kwargs = dict(self.defaults)
+        kwargs.update(zip(self.fields, values))
+        return self.cls(**kwargs)
+
+def _getClassEntry(classname, count, fields):
+    codec = _codecDecoders.get(classname)
+    if codec == None:
+        cls = HproseClassManager.getClass(classname, fields)
+        if _isNamedTuple(cls) and fields != tuple(cls._fields):
+            return (_NamedTupleDecoder(cls, fields), count, fields, (None, None))
+        return (cls, count, fields, _getDecodePlan(cls, fields))
+    return (_CodecDecoder(codec[0], fields, codec[1]), count, fields, (None, None))
+
 class HproseReader(HproseRawReader):
-    def __init__(self, stream, simple = False):
+    unserializers = _unserializers
+    typedUnserializers = _typedUnserializers
+    def __init__(self, stream, simple = False, refer = None):
         super(HproseReader, self).__init__(stream)
-        self.refer = FakeReaderRefer() if simple else RealReaderRefer()
+        if simple:
+            self.refer = FakeReaderRefer()
+        elif refer == None:
+            self.refer = RealReaderRefer()
+        else:
+            self.refer = refer()
         self.classref = []
+        (self._unserializers,
+         self._typedUnserializers) = _getUnserializers(self.__class__)
     def unserialize(self):
         tag = self.stream.read(1)
-        if b'0' <= tag <= b'9':
-            return int(tag, 10)
-        if (tag == HproseTags.TagInteger or
-            tag == HproseTags.TagLong):
-            return self.__readIntegerWithoutTag()
-        if tag == HproseTags.TagDouble:
-            return self.__readDoubleWithoutTag()
-        if tag == HproseTags.TagNull:
-            return None
-        if tag == HproseTags.TagEmpty:
-            return ''
-        if tag == HproseTags.TagTrue:
-            return True
-        if tag == HproseTags.TagFalse:
-            return False
-        if tag == HproseTags.TagNaN:
-            return NaN
-        if tag == HproseTags.TagInfinity:
-            return self.__readInfinityWithoutTag()
-        if tag == HproseTags.TagDate:
-            return self.readDateWithoutTag()
-        if tag == HproseTags.TagTime:
-            return self.readTimeWithoutTag()
-        if tag == HproseTags.TagBytes:
-            return self.readBytesWithoutTag()
-        if tag == HproseTags.TagUTF8Char:
-            return self.__readUTF8CharWithoutTag()
-        if tag == HproseTags.TagString:
-            return self.readStringWithoutTag()
-        if tag == HproseTags.TagGuid:
-            return self.readGuidWithoutTag()
-        if tag == HproseTags.TagList:
-            return self.readListWithoutTag()
-        if tag == HproseTags.TagMap:
-            return self.readMapWithoutTag()
-        if tag == HproseTags.TagClass:
-            self.__readClass()
-            return self.readObject()
-        if tag == HproseTags.TagObject:
-            return self.readObjectWithoutTag()
-        if tag == HproseTags.TagRef:
-            return self.__readRef()
-        if tag == HproseTags.TagError:
-            raise HproseException(self.readString())
-        self.unexpectedTag(tag)
+        unserializer = self._unserializers.get(tag)
+        if unserializer == None:
+            self.unexpectedTag(tag)
+        return unserializer(self)
+    def _dispatch(self, unserializers):
+        tag = self.stream.read(1)
+        unserializer = unserializers.get(tag)
+        if unserializer == None:
+            self.unexpectedTag(tag)
+        return unserializer(self)
     def checkTag(self, expectTag):
         tag = self.stream.read(1)
         if tag != expectTag:
@@ -369,36 +702,19 @@ class HproseReader(HproseRawReader):
         if tag not in expectTags:
             self.unexpectedTag(tag, b''.join(expectTags))
         return tag
-    def __readIntegerWithoutTag(self):
+    def readIntegerWithoutTag(self):
         return int(_readuntil(self.stream, HproseTags.TagSemicolon), 10)
     def readInteger(self):
-        tag = self.stream.read(1)
-        if b'0' <= tag <= b'9':
-            return int(tag, 10)
-        if (tag == HproseTags.TagInteger or
-            tag == HproseTags.TagLong):
-            return self.__readIntegerWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['Integer'])
     def readLongWithoutTag(self):
-        return self.__readIntegerWithoutTag()
+        return self.readIntegerWithoutTag()
     def readLong(self):
         return self.readInteger()
-    def __readDoubleWithoutTag(self):
+    def readDoubleWithoutTag(self):
         return float(_readuntil(self.stream, HproseTags.TagSemicolon))
     def readDouble(self):
-        tag = self.stream.read(1)
-        if b'0' <= tag <= b'9':
-            return float(tag)
-        if (tag == HproseTags.TagInteger or
-            tag == HproseTags.TagLong or
-            tag == HproseTags.TagDouble):
-            return self.__readDoubleWithoutTag()
-        if tag == HproseTags.TagNaN:
-            return NaN
-        if tag == HproseTags.TagInfinity:
-            return self.__readInfinityWithoutTag()
-        self.unexpectedTag(tag)
-    def __readInfinityWithoutTag(self):
+        return self._dispatch(self._typedUnserializers['Double'])
+    def readInfinityWithoutTag(self):
         if self.stream.read(1) == HproseTags.TagNeg:
             return NegInf
         else:
@@ -407,15 +723,17 @@ class HproseReader(HproseRawReader):
         tag = self.checkTags((HproseTags.TagTrue, HproseTags.TagFalse))
         return tag == HproseTags.TagTrue
     def readDateWithoutTag(self):
-        year = int(self.stream.read(4), 10)
-        month = int(self.stream.read(2), 10)
-        day = int(self.stream.read(2), 10)
-        tag = self.stream.read(1)
+        s = self.stream.read(9)
+        ymd = int(s[:8], 10)
+        (year, md) = divmod(ymd, 10000)
+        (month, day) = divmod(md, 100)
+        tag = s[8:9]
         if tag == HproseTags.TagTime:
-            hour = int(self.stream.read(2), 10)
-            minute = int(self.stream.read(2), 10)
-            second = int(self.stream.read(2), 10)
-            (tag, microsecond) = self.__readMicrosecond()
+            s = self.stream.read(7)
+            hms = int(s[:6], 10)
+            (hour, ms) = divmod(hms, 10000)
+            (minute, second) = divmod(ms, 100)
+            (tag, microsecond) = self.__readMicrosecond(s[6:7])
             if tag == HproseTags.TagUTC:
                 d = datetime.datetime(year, month, day, hour, minute, second, microsecond, utc)
             else:
@@ -427,16 +745,13 @@ class HproseReader(HproseRawReader):
         self.refer.set(d)
         return d
     def readDate(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagDate: return self.readDateWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['Date'])
     def readTimeWithoutTag(self):
-        hour = int(self.stream.read(2), 10)
-        minute = int(self.stream.read(2), 10)
-        second = int(self.stream.read(2), 10)
-        (tag, microsecond) = self.__readMicrosecond()
+        s = self.stream.read(7)
+        hms = int(s[:6], 10)
+        (hour, ms) = divmod(hms, 10000)
+        (minute, second) = divmod(ms, 100)
+        (tag, microsecond) = self.__readMicrosecond(s[6:7])
         if tag == HproseTags.TagUTC:
             t = datetime.time(hour, minute, second, microsecond, utc)
         else:
@@ -444,24 +759,15 @@ class HproseReader(HproseRawReader):
         self.refer.set(t)
         return t
     def readTime(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagTime: return self.readTimeWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['Time'])
     def readBytesWithoutTag(self):
         b = self.stream.read(_readint(self.stream, HproseTags.TagQuote))
         self.stream.read(1)
         self.refer.set(b)
         return b
     def readBytes(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagEmpty: return b''
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagBytes: return self.readBytesWithoutTag()
-        self.unexpectedTag(tag)
-    def __readUTF8CharWithoutTag(self):
+        return self._dispatch(self._typedUnserializers['Bytes'])
+    def readUTF8CharWithoutTag(self):
         s = []
         c = self.stream.read(1)
         s.append(c)
@@ -475,115 +781,1038 @@ class HproseReader(HproseRawReader):
         return str(b''.join(s), 'utf-8')
     def __readString(self):
         l = _readint(self.stream, HproseTags.TagQuote)
-        s = []
-        i = 0
-        while i < l:
-            c = self.stream.read(1)
-            s.append(c)
-            a = ord(c)
-            if (a & 0xE0) == 0xC0:
-                s.append(self.stream.read(1))
-            elif (a & 0xF0) == 0xE0:
-                s.append(self.stream.read(2))
-            elif (a & 0xF8) == 0xF0:
-                s.append(self.stream.read(3))
-                i += 1
-            i += 1
-        self.stream.read(1)
-        s = str(b''.join(s), 'utf-8')
-        return s
+        return str(_readstring(self.stream, l), 'utf-8')
     def readStringWithoutTag(self):
         s = self.__readString()
         self.refer.set(s)
         return s
     def readString(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagEmpty: return ''
-        if tag == HproseTags.TagUTF8Char: return self.__readUTF8CharWithoutTag()
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagString: return self.readStringWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['String'])
     def readGuidWithoutTag(self):
-        u = UUID(str(self.stream.read(38), 'utf-8'))
+        u = _readguid(self.stream.read(38))
         self.refer.set(u)
         return u
     def readGuid(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagGuid: return self.readGuidWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['Guid'])
     def readListWithoutTag(self):
+        c = _readint(self.stream, HproseTags.TagOpenbrace)
         l = []
         self.refer.set(l)
-        c = _readint(self.stream, HproseTags.TagOpenbrace)
-        for _ in range(c): l.append(self.unserialize())
+        unserialize = self.unserialize
+        append = l.append
+        for _ in range(c): append(unserialize())
         self.stream.read(1)
         return l
     def readList(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagList: return self.readListWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['List'])
+    def readNDArray(self, dtype = None):
+        if numpy == None: raise HproseException('NumPy is required to read ndarray')
+        l = self._dispatch(self._typedUnserializers['NDArray'])
+        if isinstance(l, list): l = numpy.asarray(l, dtype)
+        elif isinstance(l, bytes): l = numpy.frombuffer(l, numpy.uint8 if dtype == None else dtype).copy()
+        return l
     def readMapWithoutTag(self):
         m = {}
         self.refer.set(m)
         c = _readint(self.stream, HproseTags.TagOpenbrace)
         for _ in range(c):
             k = self.unserialize()
+            if type(k) is str: k = _intern(k)
             v = self.unserialize()
             m[k] = v
         self.stream.read(1)
         return m
     def readMap(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagMap: return self.readMapWithoutTag()
-        self.unexpectedTag(tag)
+        return self._dispatch(self._typedUnserializers['Map'])
     def readObjectWithoutTag(self):
-        (cls, count, fields) = self.classref[_readint(self.stream, HproseTags.TagOpenbrace)]
-        obj = cls()
-        self.refer.set(obj)
-        for i in range(count): setattr(obj, fields[i], self.unserialize())
+        (cls, count, fields, (new, setters)) = self.classref[_readint(self.stream, HproseTags.TagOpenbrace)]
+        unserialize = self.unserialize
+        if new == None:
+            index = self.refer.reserve()
+            obj = cls._make([unserialize() for _ in range(count)])
+            self.refer.update(index, obj)
+        else:
+            obj = new()
+            self.refer.set(obj)
+            if setters == None:
+                data = obj.__dict__
+                for name in fields: data[name] = unserialize()
+            else:
+                for setter in setters: setter(obj, unserialize())
         self.stream.read(1)
         return obj
     def readObject(self):
-        tag = self.stream.read(1)
-        if tag == HproseTags.TagNull: return None
-        if tag == HproseTags.TagRef: return self.__readRef()
-        if tag == HproseTags.TagObject: return self.readObjectWithoutTag()
-        if tag == HproseTags.TagClass:
-            self.__readClass()
-            return self.readObject()
-        self.unexpectedTag(tag)
-    def __readClass(self):
+        return self._dispatch(self._typedUnserializers['Object'])
+    def readClassWithoutTag(self):
         classname = self.__readString()
         count = _readint(self.stream, HproseTags.TagOpenbrace)
-        fields = [self.readString() for _ in range(count)]
+        fields = tuple([_intern(self.readString()) for _ in range(count)])
         self.stream.read(1)
-        cls = HproseClassManager.getClass(classname)
-        self.classref.append((cls, count, fields))
-    def __readRef(self):
+        self.classref.append(_getClassEntry(classname, count, fields))
+    def readRefWithoutTag(self):
         return self.refer.read(_readint(self.stream, HproseTags.TagSemicolon))
+    def __readMicrosecond(self, tag):
+        if tag != HproseTags.TagPoint: return (tag, 0)
+        s = self.stream.read(4)
+        microsecond = int(s[:3], 10) * 1000
+        tag = s[3:4]
+        if b'0' <= tag <= b'9':
+            s = self.stream.read(3)
+            microsecond += int(tag + s[:2], 10)
+            tag = s[2:3]
+            if b'0' <= tag <= b'9':
+                tag = self.stream.read(3)[2:3]
+        return (tag, microsecond)
+    def reset(self):
+        del self.classref[:]
+        self.refer.reset()
+
+_bulkTags = frozenset([HproseTags.TagInteger, HproseTags.TagLong, HproseTags.TagDouble] +
+                      [b'%d' % i for i in range(10)])
+_bulkIntegerTokens = re.compile(rb'(?<=[il])[-+]?[0-9]+|[0-9]')
+
+def _readbulk(data, pos, count):
+    end = data.find(HproseTags.TagClosebrace, pos)
+    if end < 0: return None
+    try:
+        if data[pos:pos + 1] == HproseTags.TagDouble:
+            if data[end - 1:end] != HproseTags.TagSemicolon: return None
+            values = list(map(float, data[pos + 1:end - 1].split(b';d')))
+        else:
+            segment = data[pos:end]
+            if segment.translate(None, b'0123456789il;+-'): return None
+            semicolons = segment.count(HproseTags.TagSemicolon)
+            if semicolons != segment.count(HproseTags.TagInteger) + segment.count(HproseTags.TagLong):
+                return None
+            if semicolons == count:
+                values = list(map(int, segment[1:-1].replace(b'l', b'i').split(b';i')))
+            else:
+                values = list(map(int, _bulkIntegerTokens.findall(segment)))
+    except ValueError:
+        return None
+    if len(values) != count: return None
+    return (values, end + 1)
+
+_bulkReaderCache = {}
+
+def _readsBulk(cls):
+    bulk = _bulkReaderCache.get(cls)
+    if bulk == None:
+        base = _getUnserializers(HproseBufferReader)[0]
+        unserializers = _getUnserializers(cls)[0]
+        bulk = all(unserializers.get(tag) is base[tag]
+                   for tag in _bulkTags | frozenset([HproseTags.TagNaN, HproseTags.TagInfinity]))
+        bulk = _bulkReaderCache.setdefault(cls, bulk)
+    return bulk
+
+_ndSeparators = bytes.maketrans(b'ild;', b'    ')
+
+def _readndarray(data, pos, count, dtype):
+    end = data.find(HproseTags.TagClosebrace, pos)
+    if end < 0: return None
+    segment = data[pos:end]
+    if segment.translate(None, b'0123456789ild;+-.eENI'): return None
+    special = (HproseTags.TagNaN in segment) or (HproseTags.TagInfinity in segment)
+    if dtype == None:
+        if special or (HproseTags.TagDouble in segment):
+            dtype = numpy.float64
+        elif HproseTags.TagLong in segment:
+            return None
+        else:
+            dtype = numpy.int64
+    text = segment.translate(_ndSeparators)
+    if segment.count(HproseTags.TagSemicolon) != count:
+        u = numpy.frombuffer(segment, numpy.int8)
+        closes = (u == ord(';'))
+        depth = numpy.cumsum(((u == ord('i')) | (u == ord('l')) | (u == ord('d'))).view(numpy.int8) -
+                             closes.view(numpy.int8), dtype = numpy.int32)
+        bare = (u >= ord('0')) & (u <= ord('9')) & (depth + closes <= 0)
+        text = numpy.insert(numpy.frombuffer(text, numpy.uint8),
+                            numpy.flatnonzero(bare) + 1, ord(' ')).tobytes()
+    if special:
+        text = text.replace(b'N', b' nan ').replace(b'I+', b' inf ').replace(b'I-', b' -inf ')
+    try:
+        values = numpy.fromstring(text, dtype, sep = ' ')
+    except ValueError:
+        return None
+    if len(values) != count: return None
+    return (values, end + 1)
+
+def _tobytes(data):
+    if isinstance(data, bytes):
+        return data
+    if (isinstance(data, memoryview) and
+        isinstance(data.obj, bytes) and
+        data.nbytes == len(data.obj)):
+        return data.obj
+    return bytes(data)
+
+def _skipstring(buf, pos, count):
+    end = pos + count
+    s = buf[pos:end]
+    if len(s) == count and s.isascii():
+        return end
+    count -= _utf16length(s)
+    while count > 0:
+        s = buf[end:end + count]
+        if len(s) == 0: raise HproseException('No byte found in stream')
+        end += count
+        count -= _utf16length(s)
+    while end < len(buf) and (buf[end] & 0xC0) == 0x80:
+        end += 1
+    return end
+
+def _skipraw(buf, pos, refs = None, classes = None):
+    depth = 0
+    while True:
+        tag = buf[pos:pos + 1]
+        pos += 1
+        if ((b'0' <= tag <= b'9') or
+            (tag == HproseTags.TagNull) or
+            (tag == HproseTags.TagEmpty) or
+            (tag == HproseTags.TagTrue) or
+            (tag == HproseTags.TagFalse) or
+            (tag == HproseTags.TagNaN)):
+            pass
+        elif tag == HproseTags.TagInfinity:
+            pos += 1
+        elif ((tag == HproseTags.TagInteger) or
+            (tag == HproseTags.TagLong) or
+            (tag == HproseTags.TagDouble) or
+            (tag == HproseTags.TagRef)):
+            pos = buf.index(HproseTags.TagSemicolon, pos) + 1
+        elif ((tag == HproseTags.TagDate) or
+            (tag == HproseTags.TagTime)):
+            if refs != None: refs.append(pos - 1)
+            while True:
+                c = buf[pos:pos + 1]
+                pos += 1
+                if ((c == HproseTags.TagSemicolon) or
+                    (c == HproseTags.TagUTC)): break
+                if c == b'': raise HproseException('No byte found in stream')
+        elif (tag == HproseTags.TagUTF8Char):
+            pos = _skipstring(buf, pos, 1)
+        elif (tag == HproseTags.TagBytes):
+            if refs != None: refs.append(pos - 1)
+            p = buf.index(HproseTags.TagQuote, pos)
+            pos = p + int(buf[pos:p] or b'0', 10) + 2
+        elif (tag == HproseTags.TagString):
+            if refs != None: refs.append(pos - 1)
+            p = buf.index(HproseTags.TagQuote, pos)
+            pos = _skipstring(buf, p + 1, int(buf[pos:p] or b'0', 10)) + 1
+        elif (tag == HproseTags.TagGuid):
+            if refs != None: refs.append(pos - 1)
+            pos += 38
+        elif ((tag == HproseTags.TagList) or
+            (tag == HproseTags.TagMap) or
+            (tag == HproseTags.TagObject)):
+            if refs != None: refs.append(pos - 1)
+            pos = buf.index(HproseTags.TagOpenbrace, pos) + 1
+            depth += 1
+            continue
+        elif (tag == HproseTags.TagClass):
+            if classes != None: classes.append(pos - 1)
+            pos = buf.index(HproseTags.TagOpenbrace, pos) + 1
+            while buf[pos:pos + 1] != HproseTags.TagClosebrace:
+                pos = _skipraw(buf, pos, refs)
+            pos += 1
+            continue
+        elif (tag == HproseTags.TagError):
+            continue
+        elif (tag == HproseTags.TagClosebrace) and (depth > 0):
+            depth -= 1
+        elif tag == b'':
+            raise HproseException('No byte found in stream')
+        else:
+            raise HproseException(
+                "Unexpected serialize tag '%s' in stream" %
+                str(tag, 'utf-8'))
+        if depth == 0: return pos
+
+class HproseBufferReader(HproseReader):
+    def __init__(self, data, simple = False, view = False, refer = None):
+        super(HproseBufferReader, self).__init__(None, simple, refer)
+        self.data = _tobytes(data)
+        self.view = memoryview(data).cast('B') if view else None
+        self.pos = 0
+        self._bulk = _readsBulk(self.__class__)
+    def read(self, n):
+        pos = self.pos
+        self.pos = pos + n
+        return self.data[pos:pos + n]
+    def readIndex(self):
+        (index, self.pos) = _indexraw(self.data, self.pos)
+        return (self.data, index)
+    def readNDArray(self, dtype = None):
+        pos = self.pos
+        if numpy != None and self._bulk and self.data[pos:pos + 1] == HproseTags.TagList:
+            self.pos = pos + 1
+            count = self._readint(HproseTags.TagOpenbrace)
+            bulk = _readndarray(self.data, self.pos, count, dtype)
+            if bulk != None:
+                (array, self.pos) = bulk
+                self.refer.set(array)
+                return array
+            self.pos = pos
+        return super(HproseBufferReader, self).readNDArray(dtype)
+    def __readuntil(self, char):
+        data = self.data
+        pos = self.pos
+        i = data.find(char, pos)
+        if i < 0:
+            i = len(data)
+            self.pos = i
+        else:
+            self.pos = i + 1
+        return data[pos:i]
+    def _readint(self, char):
+        s = self.__readuntil(char)
+        if s == b'': return 0
+        return int(s, 10)
+    def _readcount(self):
+        c = self._readint(HproseTags.TagOpenbrace)
+        if c > len(self.data) - self.pos:
+            raise HproseException('No byte found in stream')
+        return c
+    def readRaw(self, ostream = None, tag = None):
+        if ostream == None:
+            ostream = BytesIO()
+        start = self.pos
+        if tag == None:
+            pos = start
+        else:
+            ostream.write(tag)
+            pos = start - 1
+        try:
+            self.pos = _skipraw(self.data, pos)
+        except (IndexError, ValueError):
+            raise HproseException('No byte found in stream')
+        ostream.write(self.data[start:self.pos])
+        return ostream
+    def unserialize(self):
+        pos = self.pos
+        tag = self.data[pos:pos + 1]
+        self.pos = pos + 1
+        unserializer = self._unserializers.get(tag)
+        if unserializer == None:
+            self.unexpectedTag(tag)
+        return unserializer(self)
+    def _dispatch(self, unserializers):
+        pos = self.pos
+        tag = self.data[pos:pos + 1]
+        self.pos = pos + 1
+        unserializer = unserializers.get(tag)
+        if unserializer == None:
+            self.unexpectedTag(tag)
+        return unserializer(self)
+    def checkTag(self, expectTag):
+        tag = self.read(1)
+        if tag != expectTag:
+            self.unexpectedTag(tag, expectTag)
+    def checkTags(self, expectTags):
+        tag = self.read(1)
+        if tag not in expectTags:
+            self.unexpectedTag(tag, b''.join(expectTags))
+        return tag
+    def readIntegerWithoutTag(self):
+        return int(self.__readuntil(HproseTags.TagSemicolon), 10)
+    def readLongWithoutTag(self):
+        return int(self.__readuntil(HproseTags.TagSemicolon), 10)
+    def readDoubleWithoutTag(self):
+        return float(self.__readuntil(HproseTags.TagSemicolon))
+    def readInfinityWithoutTag(self):
+        if self.read(1) == HproseTags.TagNeg:
+            return NegInf
+        else:
+            return PosInf
+    def readDateWithoutTag(self):
+        data = self.data
+        pos = self.pos
+        ymd = int(data[pos:pos + 8], 10)
+        (year, md) = divmod(ymd, 10000)
+        (month, day) = divmod(md, 100)
+        tag = data[pos + 8:pos + 9]
+        self.pos = pos + 9
+        if tag == HproseTags.TagTime:
+            pos += 9
+            hms = int(data[pos:pos + 6], 10)
+            (hour, ms) = divmod(hms, 10000)
+            (minute, second) = divmod(ms, 100)
+            self.pos = pos + 6
+            (tag, microsecond) = self.__readMicrosecond()
+            if tag == HproseTags.TagUTC:
+                d = datetime.datetime(year, month, day, hour, minute, second, microsecond, utc)
+            else:
+                d = datetime.datetime(year, month, day, hour, minute, second, microsecond)
+        elif tag == HproseTags.TagUTC:
+            d = datetime.datetime(year, month, day, 0, 0, 0, 0, utc)
+        else:
+            d = datetime.date(year, month, day)
+        self.refer.set(d)
+        return d
+    def readTimeWithoutTag(self):
+        data = self.data
+        pos = self.pos
+        hms = int(data[pos:pos + 6], 10)
+        (hour, ms) = divmod(hms, 10000)
+        (minute, second) = divmod(ms, 100)
+        self.pos = pos + 6
+        (tag, microsecond) = self.__readMicrosecond()
+        if tag == HproseTags.TagUTC:
+            t = datetime.time(hour, minute, second, microsecond, utc)
+        else:
+            t = datetime.time(hour, minute, second, microsecond)
+        self.refer.set(t)
+        return t
+    def readBytesWithoutTag(self):
+        count = self._readint(HproseTags.TagQuote)
+        pos = self.pos
+        if self.view == None:
+            b = self.data[pos:pos + count]
+        else:
+            b = self.view[pos:pos + count]
+        self.pos = pos + count + 1
+        self.refer.set(b)
+        return b
+    def readUTF8CharWithoutTag(self):
+        data = self.data
+        pos = self.pos
+        a = data[pos]
+        if (a & 0xE0) == 0xC0:
+            end = pos + 2
+        elif (a & 0xF0) == 0xE0:
+            end = pos + 3
+        elif a > 0x7F:
+            raise HproseException('Bad utf-8 encoding')
+        else:
+            end = pos + 1
+        self.pos = end
+        return str(data[pos:end], 'utf-8')
+    def __readString(self):
+        count = self._readint(HproseTags.TagQuote)
+        data = self.data
+        pos = self.pos
+        end = _skipstring(data, pos, count)
+        self.pos = end + 1
+        return str(data[pos:end], 'utf-8')
+    def readStringWithoutTag(self):
+        s = self.__readString()
+        self.refer.set(s)
+        return s
+    def readGuidWithoutTag(self):
+        u = _readguid(self.read(38))
+        self.refer.set(u)
+        return u
+    def readListWithoutTag(self):
+        c = self._readcount()
+        if c >= 16 and self._bulk and self.data[self.pos:self.pos + 1] in _bulkTags:
+            bulk = _readbulk(self.data, self.pos, c)
+            if bulk != None:
+                (l, self.pos) = bulk
+                self.refer.set(l)
+                return l
+        l = [None] * c
+        self.refer.set(l)
+        unserialize = self.unserialize
+        for i in range(c): l[i] = unserialize()
+        self.pos += 1
+        return l
+    def readMapWithoutTag(self):
+        m = {}
+        self.refer.set(m)
+        c = self._readint(HproseTags.TagOpenbrace)
+        unserialize = self.unserialize
+        for _ in range(c):
+            k = unserialize()
+            if type(k) is str: k = _intern(k)
+            m[k] = unserialize()
+        self.pos += 1
+        return m
+    def readObjectWithoutTag(self):
+        (cls, count, fields, (new, setters)) = self.classref[self._readint(HproseTags.TagOpenbrace)]
+        unserialize = self.unserialize
+        if new == None:
+            index = self.refer.reserve()
+            obj = cls._make([unserialize() for _ in range(count)])
+            self.refer.update(index, obj)
+        else:
+            obj = new()
+            self.refer.set(obj)
+            if setters == None:
+                data = obj.__dict__
+                for name in fields: data[name] = unserialize()
+            else:
+                for setter in setters: setter(obj, unserialize())
+        self.pos += 1
+        return obj
+    def readClassWithoutTag(self):
+        classname = self.__readString()
+        count = self._readint(HproseTags.TagOpenbrace)
+        fields = tuple([_intern(self.readString()) for _ in range(count)])
+        self.pos += 1
+        self.classref.append(_getClassEntry(classname, count, fields))
+    def readRefWithoutTag(self):
+        return self.refer.read(self._readint(HproseTags.TagSemicolon))
     def __readMicrosecond(self):
+        data = self.data
+        pos = self.pos
         microsecond = 0
-        tag = self.stream.read(1)
+        tag = data[pos:pos + 1]
+        pos += 1
         if tag == HproseTags.TagPoint:
-            microsecond = int(self.stream.read(3), 10) * 1000
-            tag = self.stream.read(1)
+            microsecond = int(data[pos:pos + 3], 10) * 1000
+            tag = data[pos + 3:pos + 4]
+            pos += 4
             if b'0' <= tag <= b'9':
-                microsecond = microsecond + int(tag, 10) * 100 + int(self.stream.read(2), 10)
-                tag = self.stream.read(1)
+                microsecond = microsecond + int(tag, 10) * 100 + int(data[pos:pos + 2], 10)
+                tag = data[pos + 2:pos + 3]
+                pos += 3
                 if b'0' <= tag <= b'9':
-                    self.stream.read(2)
-                    tag = self.stream.read(1)
+                    tag = data[pos + 2:pos + 3]
+                    pos += 3
+        self.pos = pos
         return (tag, microsecond)
+
+_iterativeReaderCache = {}
+
+class HproseIterativeReader(HproseBufferReader):
+    maxDepth = 262144
+    def __init__(self, data, simple = False, view = False, refer = None):
+        super(HproseIterativeReader, self).__init__(data, simple, view, refer)
+        cls = self.__class__
+        begins = _iterativeReaderCache.get(cls)
+        if begins == None:
+            begins = dict((tag, _iterativeBegins[unserializer])
+                          for (tag, unserializer) in self._unserializers.items()
+                          if unserializer in _iterativeBegins)
+            begins = _iterativeReaderCache.setdefault(cls, begins)
+        self.__begins = begins
+    def unserialize(self):
+        return self.__run(None)
+    def readListWithoutTag(self):
+        return self.__run(HproseIterativeReader.__beginList)
+    def readMapWithoutTag(self):
+        return self.__run(HproseIterativeReader.__beginMap)
+    def readObjectWithoutTag(self):
+        return self.__run(HproseIterativeReader.__beginObject)
+    def __run(self, begin):
+        unserializers = self._unserializers
+        begins = self.__begins
+        data = self.data
+        if begin == None:
+            pos = self.pos
+            tag = data[pos:pos + 1]
+            self.pos = pos + 1
+            if tag not in begins:
+                unserializer = unserializers.get(tag)
+                if unserializer == None:
+                    self.unexpectedTag(tag)
+                return unserializer(self)
+            begin = begins[tag]
+        (value, frame) = begin(self)
+        if not frame: return value
+        refer = self.refer
+        maxDepth = self.maxDepth
+        stack = [None]
+        while True:
+            (kind, target, i, count, aux, result) = frame
+            while i < count:
+                pos = self.pos
+                tag = data[pos:pos + 1]
+                self.pos = pos + 1
+                if tag not in begins:
+                    unserializer = unserializers.get(tag)
+                    if unserializer == None:
+                        self.unexpectedTag(tag)
+                    value = unserializer(self)
+                else:
+                    (value, child) = begins[tag](self)
+                    if child:
+                        if len(stack) > maxDepth:
+                            raise HproseException('Nesting is too deep to unserialize')
+                        frame[2] = i
+                        frame[4] = aux
+                        stack.append(frame)
+                        frame = child
+                        break
+                if kind == 0:
+                    target[i] = value
+                elif kind == 1:
+                    if i & 1:
+                        target[aux] = value
+                    else:
+                        aux = _intern(value) if type(value) is str else value
+                elif kind == 2:
+                    target[aux[i]] = value
+                else:
+                    aux[i](target, value)
+                i += 1
+            else:
+                self.pos += 1
+                if kind == 0 and aux != None:
+                    (cls, index) = aux
+                    value = cls._make(target)
+                    refer.update(index, value)
+                else:
+                    value = result
+                frame = stack.pop()
+                if not frame: return value
+                (kind, target, i, count, aux, result) = frame
+                if kind == 0:
+                    target[i] = value
+                elif kind == 1:
+                    if i & 1:
+                        target[aux] = value
+                    else:
+                        frame[4] = _intern(value) if type(value) is str else value
+                elif kind == 2:
+                    target[aux[i]] = value
+                else:
+                    aux[i](target, value)
+                frame[2] = i + 1
+    def __beginList(self):
+        c = self._readcount()
+        if c >= 16 and self._bulk and self.data[self.pos:self.pos + 1] in _bulkTags:
+            bulk = _readbulk(self.data, self.pos, c)
+            if bulk != None:
+                (l, self.pos) = bulk
+                self.refer.set(l)
+                return (l, None)
+        l = [None] * c
+        self.refer.set(l)
+        if c == 0:
+            self.pos += 1
+            return (l, None)
+        return (None, [0, l, 0, c, None, l])
+    def __beginMap(self):
+        m = {}
+        self.refer.set(m)
+        c = self._readint(HproseTags.TagOpenbrace)
+        if c == 0:
+            self.pos += 1
+            return (m, None)
+        return (None, [1, m, 0, c * 2, None, m])
+    def __beginObject(self):
+        (cls, count, fields, (new, setters)) = self.classref[self._readint(HproseTags.TagOpenbrace)]
+        if count > len(self.data) - self.pos:
+            raise HproseException('No byte found in stream')
+        if new == None:
+            index = self.refer.reserve()
+            if count > 0:
+                return (None, [0, [None] * count, 0, count, (cls, index), None])
+            obj = cls._make([])
+            self.refer.update(index, obj)
+        else:
+            obj = new()
+            self.refer.set(obj)
+            if count > 0:
+                if setters == None:
+                    return (None, [2, obj.__dict__, 0, count, fields, obj])
+                return (None, [3, obj, 0, count, setters, obj])
+        self.pos += 1
+        return (obj, None)
+
+_iterativeBegins = {
+    HproseIterativeReader.readListWithoutTag: HproseIterativeReader._HproseIterativeReader__beginList,
+    HproseIterativeReader.readMapWithoutTag: HproseIterativeReader._HproseIterativeReader__beginMap,
+    HproseIterativeReader.readObjectWithoutTag: HproseIterativeReader._HproseIterativeReader__beginObject,
+}
+
+_missing = object()
+
+class HproseLazyList(Sequence):
+    def __init__(self, reader, pos, count):
+        self.__reader = reader
+        self.__pos = pos
+        self.__count = count
+        self.__starts = None
+        self.__items = None
+    def __len__(self):
+        return self.__count
+    def __getitem__(self, index):
+        count = self.__count
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(count))]
+        if index < 0: index += count
+        if index < 0 or index >= count:
+            raise IndexError('list index out of range')
+        if self.__items == None:
+            self.__starts = self.__reader._spans(self.__pos, count)
+            self.__items = [_missing] * count
+        value = self.__items[index]
+        if value is _missing:
+            value = self.__items[index] = self.__reader._decode(self.__starts[index])
+        return value
+    def __iter__(self):
+        for i in range(self.__count): yield self[i]
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, HproseLazyList)):
+            return list(self) == list(other)
+        return NotImplemented
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+    __hash__ = None
+    def __repr__(self):
+        return repr(list(self))
+
+class HproseLazyMap(Mapping):
+    def __init__(self, reader, pos, count):
+        self.__reader = reader
+        self.__pos = pos
+        self.__count = count
+        self.__index = None
+        self.__values = {}
+    def __getIndex(self):
+        if self.__index == None:
+            starts = self.__reader._spans(self.__pos, self.__count * 2)
+            decode = self.__reader._decode
+            index = {}
+            for i in range(0, len(starts), 2):
+                key = decode(starts[i])
+                if type(key) is str: key = _intern(key)
+                index[key] = starts[i + 1]
+            self.__index = index
+        return self.__index
+    def __getitem__(self, key):
+        value = self.__values.get(key, _missing)
+        if value is _missing:
+            value = self.__values[key] = self.__reader._decode(self.__getIndex()[key])
+        return value
+    def __len__(self):
+        return len(self.__getIndex())
+    def __iter__(self):
+        return iter(self.__getIndex())
+    def __contains__(self, key):
+        return key in self.__getIndex()
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class HproseLazyReader(HproseBufferReader):
+    def __init__(self, data, simple = False):
+        super(HproseLazyReader, self).__init__(data, simple)
+        self.refer = FakeReaderRefer()
+        self.refs = None if simple else []
+        self.classes = []
+        self.cache = {}
+        self.scanned = 0
+    def _dispatch(self, unserializers):
+        pos = self.pos
+        if pos >= self.scanned:
+            self.scanned = _skipraw(self.data, pos, self.refs, self.classes)
+        return super(HproseLazyReader, self)._dispatch(unserializers)
+    def unserialize(self):
+        return self._dispatch(self._unserializers)
+    def _spans(self, pos, count):
+        data = self.data
+        starts = [0] * count
+        for i in range(count):
+            starts[i] = pos
+            pos = _skipraw(data, pos)
+        return starts
+    def _decode(self, pos):
+        value = self.cache.get(pos, _missing)
+        if value is not _missing: return value
+        data = self.data
+        tag = data[pos:pos + 1]
+        if tag == HproseTags.TagClass:
+            return self._decode(self.__skipClass(pos))
+        if ((tag == HproseTags.TagList) or
+            (tag == HproseTags.TagMap)):
+            i = data.index(HproseTags.TagOpenbrace, pos + 1)
+            count = int(data[pos + 1:i] or b'0', 10)
+            if tag == HproseTags.TagList:
+                value = HproseLazyList(self, i + 1, count)
+            else:
+                value = HproseLazyMap(self, i + 1, count)
+            self.cache[pos] = value
+            return value
+        if tag == HproseTags.TagObject:
+            i = data.index(HproseTags.TagOpenbrace, pos + 1)
+            (cls, count, fields, (new, setters)) = self.__getClass(int(data[pos + 1:i], 10))
+            values = [None] * count if new == None else None
+            obj = self.cache[pos] = values if new == None else new()
+            i += 1
+            for k in range(count):
+                if new == None:
+                    values[k] = self._decode(i)
+                elif setters == None:
+                    obj.__dict__[fields[k]] = self._decode(i)
+                else:
+                    setters[k](obj, self._decode(i))
+                i = _skipraw(data, i)
+            if new == None:
+                obj = self.cache[pos] = cls._make(values)
+            return obj
+        unserializer = self._unserializers.get(tag)
+        if unserializer == None:
+            self.unexpectedTag(tag)
+        self.pos = pos + 1
+        return unserializer(self)
+    def __skipClass(self, pos):
+        data = self.data
+        pos = data.index(HproseTags.TagOpenbrace, pos) + 1
+        while data[pos:pos + 1] != HproseTags.TagClosebrace:
+            pos = _skipraw(data, pos)
+        return pos + 1
+    def __getClass(self, index):
+        classref = self.classref
+        pos = self.pos
+        while len(classref) <= index:
+            self.pos = self.classes[len(classref)] + 1
+            super(HproseLazyReader, self).readClassWithoutTag()
+        self.pos = pos
+        return classref[index]
+    def __readContainer(self):
+        pos = self.pos - 1
+        value = self._decode(pos)
+        self.pos = _skipraw(self.data, pos)
+        return value
+    readListWithoutTag = __readContainer
+    readMapWithoutTag = __readContainer
+    readObjectWithoutTag = __readContainer
+    def readClassWithoutTag(self):
+        self.pos = self.__skipClass(self.pos - 1)
+    def readRefWithoutTag(self):
+        index = self.readIntegerWithoutTag()
+        if self.refs == None: return self.refer.read(index)
+        pos = self.pos
+        value = self._decode(self.refs[index])
+        self.pos = pos
+        return value
     def reset(self):
-        del self.classref[:]
-        self.refer.reset()
+        super(HproseLazyReader, self).reset()
+        self.refs = None if self.refs == None else []
+        self.classes = []
+        self.cache = {}
+
+def _scanstring(buf, pos, count, end):
+    if pos + count <= end and buf[pos:pos + count].isascii():
+        return (pos + count, 0)
+    while count > 0 and pos < end:
+        a = buf[pos]
+        if (a & 0xE0) == 0xC0:
+            n = 2
+        elif (a & 0xF0) == 0xE0:
+            n = 3
+        elif (a & 0xF8) == 0xF0:
+            n = 4
+            count -= 1
+        else:
+            n = 1
+        if pos + n > end:
+            if n == 4: count += 1
+            break
+        pos += n
+        count -= 1
+    return (pos, count)
+
+class HproseIncrementalReader(object):
+    def __init__(self, simple = False, refer = None):
+        self.buffer = bytearray()
+        self.pos = 0
+        self.reader = HproseBufferReader(b'', simple, refer = refer)
+        self.reader.data = self.buffer
+        self.stack = []
+        self.partial = None
+        self.values = []
+    def feed(self, chunk):
+        buf = self.buffer
+        if self.pos > 0 and self.pos * 2 >= len(buf):
+            partial = self.partial
+            if partial != None:
+                partial[0] -= self.pos
+                partial[1] -= self.pos
+                partial[2] -= self.pos
+            del buf[:self.pos]
+            self.pos = 0
+        buf.extend(chunk)
+        self.__parse()
+    def results(self):
+        values = self.values
+        self.values = []
+        return values
+    def close(self):
+        if self.stack or self.partial != None or self.pos < len(self.buffer):
+            raise HproseException('No byte found in stream')
+    def reset(self):
+        self.reader.reset()
+    def __parse(self):
+        buf = self.buffer
+        end = len(buf)
+        reader = self.reader
+        refer = reader.refer
+        stack = self.stack
+        while True:
+            pos = self.pos
+            if stack and stack[-1][2] == 0:
+                frame = stack[-1]
+                if pos >= end: return
+                if buf[pos:pos + 1] != HproseTags.TagClosebrace:
+                    reader.unexpectedTag(buf[pos:pos + 1], HproseTags.TagClosebrace)
+                self.pos = pos + 1
+                stack.pop()
+                value = frame[1]
+                if frame[0] == HproseTags.TagObject and frame[3][3] != None:
+                    value = frame[3][0]._make(value)
+                    refer.update(frame[3][3], value)
+            else:
+                if pos >= end: return
+                tag = bytes(buf[pos:pos + 1])
+                if b'0' <= tag <= b'9':
+                    value = int(tag, 10)
+                    self.pos = pos + 1
+                elif ((tag == HproseTags.TagInteger) or
+                      (tag == HproseTags.TagLong) or
+                      (tag == HproseTags.TagDouble) or
+                      (tag == HproseTags.TagRef)):
+                    i = buf.find(HproseTags.TagSemicolon, pos + 1)
+                    if i < 0: return
+                    reader.pos = pos + 1
+                    value = reader._unserializers[tag](reader)
+                    self.pos = reader.pos
+                elif ((tag == HproseTags.TagDate) or
+                      (tag == HproseTags.TagTime)):
+                    i = buf.find(HproseTags.TagSemicolon, pos + 1)
+                    j = buf.find(HproseTags.TagUTC, pos + 1)
+                    if i < 0 and j < 0: return
+                    reader.pos = pos + 1
+                    value = reader._unserializers[tag](reader)
+                    self.pos = reader.pos
+                elif tag == HproseTags.TagInfinity:
+                    if pos + 2 > end: return
+                    reader.pos = pos + 1
+                    value = reader.readInfinityWithoutTag()
+                    self.pos = reader.pos
+                elif tag == HproseTags.TagUTF8Char:
+                    if pos + 2 > end: return
+                    if _scanstring(buf, pos + 1, 1, end)[1] > 0: return
+                    reader.pos = pos + 1
+                    value = reader.readUTF8CharWithoutTag()
+                    self.pos = reader.pos
+                elif tag == HproseTags.TagGuid:
+                    if pos + 39 > end: return
+                    reader.pos = pos + 1
+                    value = reader.readGuidWithoutTag()
+                    self.pos = reader.pos
+                elif tag == HproseTags.TagString:
+                    value = self.__readString(pos)
+                    if value == None: return
+                elif tag == HproseTags.TagBytes:
+                    i = buf.find(HproseTags.TagQuote, pos + 1)
+                    if i < 0: return
+                    count = int(buf[pos + 1:i] or b'0', 10)
+                    if i + count + 2 > end: return
+                    value = bytes(buf[i + 1:i + count + 1])
+                    refer.set(value)
+                    self.pos = i + count + 2
+                elif ((tag == HproseTags.TagList) or
+                      (tag == HproseTags.TagMap) or
+                      (tag == HproseTags.TagObject)):
+                    i = buf.find(HproseTags.TagOpenbrace, pos + 1)
+                    if i < 0: return
+                    count = int(buf[pos + 1:i] or b'0', 10)
+                    if tag == HproseTags.TagList:
+                        container = []
+                        refer.set(container)
+                        stack.append([tag, container, count, None, 0])
+                    elif tag == HproseTags.TagMap:
+                        container = {}
+                        refer.set(container)
+                        stack.append([tag, container, count * 2, None, 0])
+                    else:
+                        (cls, count, fields, (new, setters)) = reader.classref[count]
+                        if new == None:
+                            container = []
+                            index = refer.reserve()
+                        else:
+                            container = new()
+                            index = None
+                            refer.set(container)
+                        stack.append([tag, container, count, (cls, fields, setters, index), 0])
+                    self.pos = i + 1
+                    continue
+                elif tag == HproseTags.TagClass:
+                    if not self.__readClass(pos): return
+                    continue
+                elif tag == HproseTags.TagError:
+                    stack.append([tag, None, 1, None, 0])
+                    self.pos = pos + 1
+                    continue
+                else:
+                    unserializer = reader._unserializers.get(tag)
+                    if unserializer == None:
+                        reader.unexpectedTag(tag)
+                    value = unserializer(reader)
+                    self.pos = pos + 1
+            if not stack:
+                self.values.append(value)
+                continue
+            frame = stack[-1]
+            tag = frame[0]
+            if tag == HproseTags.TagList:
+                frame[1].append(value)
+            elif tag == HproseTags.TagMap:
+                if frame[2] % 2 == 0:
+                    frame[3] = _intern(value) if type(value) is str else value
+                else:
+                    frame[1][frame[3]] = value
+            elif tag == HproseTags.TagObject:
+                (cls, fields, setters, index) = frame[3]
+                if index != None:
+                    frame[1].append(value)
+                elif setters == None:
+                    frame[1].__dict__[fields[frame[4]]] = value
+                else:
+                    setters[frame[4]](frame[1], value)
+                frame[4] += 1
+            else:
+                stack.pop()
+                raise HproseException(value)
+            frame[2] -= 1
+    def __readString(self, pos):
+        buf = self.buffer
+        partial = self.partial
+        if partial == None:
+            i = buf.find(HproseTags.TagQuote, pos + 1)
+            if i < 0: return None
+            partial = [pos, i + 1, i + 1, int(buf[pos + 1:i] or b'0', 10)]
+        partial[2], partial[3] = _scanstring(buf, partial[2], partial[3], len(buf))
+        if partial[3] > 0 or partial[2] >= len(buf):
+            self.partial = partial
+            return None
+        self.partial = None
+        value = str(buf[partial[1]:partial[2]], 'utf-8')
+        self.reader.refer.set(value)
+        self.pos = partial[2] + 1
+        return value
+    def __readClass(self, pos):
+        buf = self.buffer
+        end = len(buf)
+        i = buf.find(HproseTags.TagQuote, pos + 1)
+        if i < 0: return False
+        (i, count) = _scanstring(buf, i + 1, int(buf[pos + 1:i] or b'0', 10), end)
+        if count > 0: return False
+        i = buf.find(HproseTags.TagOpenbrace, i + 1)
+        if i < 0: return False
+        count = int(buf[buf.rfind(HproseTags.TagQuote, 0, i) + 1:i] or b'0', 10)
+        i += 1
+        for _ in range(count):
+            try:
+                i = _skipraw(buf, i)
+            except (IndexError, ValueError, HproseException):
+                return False
+            if i > end: return False
+        if i >= end or buf[i:i + 1] != HproseTags.TagClosebrace: return False
+        reader = self.reader
+        reader.data = bytes(buf[pos:i + 1])
+        reader.pos = 1
+        try:
+            reader.readClassWithoutTag()
+        finally:
+            reader.data = buf
+        self.pos = pos + reader.pos
+        return True
 
 dict_items = type({}.items())
 dict_keys = type({}.keys())
@@ -594,6 +1823,12 @@ class FakeWriterRefer:
         pass
     def write(self, val):
         return False
+    def release(self, val):
+        pass
+    def mark(self):
+        return 0
+    def forget(self, mark, keep = ()):
+        pass
     def reset(self):
         pass
 
@@ -608,71 +1843,433 @@ class RealWriterRefer:
     def write(self, val):
         valid = id(val)
         if (valid in self.ref):
-            self.stream.write(HproseTags.TagRef)
-            self.stream.write(str(self.ref[valid]).encode('utf-8'))
-            self.stream.write(HproseTags.TagSemicolon)
+            self.stream.write(b'r%d;' % self.ref[valid])
             return True
         return False
+    def mark(self):
+        return len(self.ref)
+    def forget(self, mark, keep = ()):
+        ref = self.ref
+        kept = []
+        while len(ref) > mark:
+            item = ref.popitem()
+            if item[0] in keep: kept.append(item)
+        ref.update(kept)
     def reset(self):
         self.ref.clear()
         self.refcount = 0
 
+class ContainerWriterRefer(RealWriterRefer):
+    def set(self, val):
+        if type(val) in _leafTypes:
+            self.refcount += 1
+        else:
+            self.ref[id(val)] = self.refcount
+            self.refcount += 1
+    def write(self, val):
+        if type(val) in _leafTypes: return False
+        valid = id(val)
+        if (valid in self.ref):
+            self.stream.write(b'r%d;' % self.ref[valid])
+            return True
+        return False
+
+class BoundedWriterRefer(RealWriterRefer):
+    def __init__(self, stream, maxsize = 65536):
+        super(BoundedWriterRefer, self).__init__(stream)
+        self.maxsize = maxsize
+    def set(self, val):
+        if self.refcount < self.maxsize:
+            self.ref[id(val)] = self.refcount
+        self.refcount += 1
+
+class AdaptiveWriterRefer(RealWriterRefer):
+    def __init__(self, stream):
+        super(AdaptiveWriterRefer, self).__init__(stream)
+        self.seen = set()
+        self.shared = set()
+    def __scan(self, val):
+        seen = self.seen
+        shared = self.shared
+        scalarTypes = _scalarTypes
+        stack = [val]
+        while stack:
+            val = stack.pop()
+            valid = id(val)
+            if valid in seen:
+                shared.add(valid)
+                continue
+            seen.add(valid)
+            if type(val) is dict:
+                stack.extend([key for key in val if type(key) not in scalarTypes])
+                val = val.values()
+            elif not isinstance(val, (list, tuple)):
+                if isclass(val) or not hasattr(val, '__dict__'):
+                    shared.add(valid)
+                    continue
+                val = vars(val).values()
+            stack.extend([item for item in val if type(item) not in scalarTypes])
+    def set(self, val):
+        if type(val) not in _leafTypes:
+            valid = id(val)
+            if valid not in self.seen: self.__scan(val)
+            if valid in self.shared: self.ref[valid] = self.refcount
+        self.refcount += 1
+    def forget(self, mark, keep = ()):
+        super(AdaptiveWriterRefer, self).forget(mark, keep)
+        self.seen.clear()
+        self.shared.clear()
+    def reset(self):
+        super(AdaptiveWriterRefer, self).reset()
+        self.seen.clear()
+        self.shared.clear()
+
+class ValueWriterRefer(RealWriterRefer):
+    def __init__(self, stream, threshold = 2, dedupBytes = False):
+        super(ValueWriterRefer, self).__init__(stream)
+        self.threshold = threshold
+        self.types = (str, bytes) if dedupBytes else (str,)
+        self.values = {}
+    def set(self, val):
+        if (type(val) in self.types) and (len(val) >= self.threshold):
+            self.values.setdefault(val, self.refcount)
+            self.refcount += 1
+        else:
+            super(ValueWriterRefer, self).set(val)
+    def write(self, val):
+        if (type(val) in self.types) and (len(val) >= self.threshold):
+            if val in self.values:
+                self.stream.write(b'r%d;' % self.values[val])
+                return True
+            return False
+        return super(ValueWriterRefer, self).write(val)
+    def reset(self):
+        super(ValueWriterRefer, self).reset()
+        self.values.clear()
+
+_binaryTypes = frozenset([bytearray, memoryview])
+
+class CanonicalWriterRefer(RealWriterRefer):
+    def __init__(self, stream):
+        super(CanonicalWriterRefer, self).__init__(stream)
+        self.values = {}
+    def set(self, val):
+        t = type(val)
+        if t in _leafTypes:
+            if t in _binaryTypes: val = bytes(val)
+            self.values.setdefault(val, self.refcount)
+        else:
+            self.ref[id(val)] = self.refcount
+        self.refcount += 1
+    def write(self, val):
+        t = type(val)
+        if t in _leafTypes:
+            if t in _binaryTypes: val = bytes(val)
+            index = self.values.get(val)
+        else:
+            index = self.ref.get(id(val))
+        if index == None: return False
+        self.stream.write(b'r%d;' % index)
+        return True
+    def release(self, val):
+        self.ref.pop(id(val), None)
+    def reset(self):
+        super(CanonicalWriterRefer, self).reset()
+        self.values.clear()
+
+class _StreamWriterRefer(object):
+    def __init__(self, refer):
+        self.refer = refer
+        self.leaves = []
+        self.write = refer.write
+    def __getStream(self):
+        return self.refer.stream
+    def __setStream(self, stream):
+        self.refer.stream = stream
+    stream = property(__getStream, __setStream)
+    def set(self, val):
+        if type(val) in _leafTypes: self.leaves.append(val)
+        self.refer.set(val)
+    def release(self, val):
+        self.refer.release(val)
+    def mark(self):
+        return self.refer.mark()
+    def forget(self, mark, keep = ()):
+        self.refer.forget(mark, keep)
+    def reset(self):
+        self.refer.reset()
+
+class HproseOutputBuffer(bytearray):
+    write = bytearray.extend
+    def getvalue(self):
+        return bytes(self)
+    def getbuffer(self):
+        return memoryview(self)
+    def close(self):
+        pass
+
+class HproseSegmentedOutputBuffer(object):
+    def __init__(self, threshold = 65536):
+        self.threshold = threshold
+        self.segments = []
+        self.buffer = HproseOutputBuffer()
+        self.write = self.buffer.extend
+    def writeSegment(self, data):
+        data = memoryview(data).cast('B')
+        if len(data) < self.threshold:
+            self.write(data)
+            return
+        if len(self.buffer) > 0:
+            self.segments.append(self.buffer)
+            self.buffer = HproseOutputBuffer()
+            self.write = self.buffer.extend
+        self.segments.append(data)
+    def getbuffers(self):
+        if len(self.buffer) > 0:
+            return self.segments + [self.buffer]
+        return list(self.segments)
+    def getvalue(self):
+        return b''.join(self.getbuffers())
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments) + len(self.buffer)
+    def close(self):
+        pass
+
+class HproseStreamOutputBuffer(object):
+    def __init__(self, sink, size = 65536):
+        if hasattr(sink, 'sendall'):
+            sink = sink.sendall
+        elif hasattr(sink, 'write'):
+            sink = sink.write
+        self.sink = sink
+        self.size = size
+        self.buffer = HproseOutputBuffer()
+        self.flushed = 0
+    def write(self, data):
+        if len(data) >= self.size:
+            self.flush()
+            self.sink(data)
+            self.flushed += len(data)
+            return
+        buffer = self.buffer
+        buffer += data
+        if len(buffer) >= self.size: self.flush()
+    writeSegment = write
+    def flush(self):
+        buffer = self.buffer
+        if len(buffer) > 0:
+            self.sink(bytes(buffer))
+            self.flushed += len(buffer)
+            del buffer[:]
+    def __len__(self):
+        return self.flushed + len(self.buffer)
+    def close(self):
+        self.flush()
+
+_integers = [(b'%d' if 0 <= i <= 9 else b'i%d;') % i for i in range(-128, 1024)]
+
+_bulkDigits = re.compile(rb'i([0-9]);')
+
+_bulkBatch = 4096
+
+def _bulkchunk(batch, token):
+    if not isinstance(batch, list): batch = batch.tolist()
+    chunk = ((token * len(batch)) % tuple(batch)).encode('utf-8')
+    return _bulkDigits.sub(rb'\1', chunk) if token == 'i%d;' else chunk
+
+def _bulkchunks(l, token):
+    if len(l) <= _bulkBatch: return (_bulkchunk(l, token),)
+    return (_bulkchunk(l[i:i + _bulkBatch], token) for i in range(0, len(l), _bulkBatch))
+
+def _bulkbooleans(a):
+    for i in range(0, len(a), _bulkBatch):
+        yield numpy.where(a[i:i + _bulkBatch], ord('t'), ord('f')).astype(numpy.uint8).tobytes()
+
+def _bulknumbers(l):
+    t = type(l[0])
+    if ((t is not int) and (t is not float)) or (len(set(map(type, l))) != 1):
+        return None
+    if t is int:
+        if min(l) < -2147483648 or max(l) > 2147483647: return None
+        return _bulkchunks(l, 'i%d;')
+    s = sum(l)
+    if s - s != 0: return None
+    return _bulkchunks(l, 'd%r;')
+
+def _ndtokens(a):
+    kind = a.dtype.kind
+    if kind == 'b':
+        return _bulkbooleans(a)
+    if kind in 'iu':
+        if a.min() < -2147483648 or a.max() > 2147483647: return None
+        return _bulkchunks(a, 'i%d;')
+    if kind == 'f' and numpy.isfinite(a).all():
+        return _bulkchunks(a, 'd%r;')
+    return None
+
+_serializerCache = {}
+
+def _getSerializers(cls):
+    serializers = _serializerCache.get(cls)
+    if serializers == None:
+        serializers = _serializerCache.setdefault(cls, {})
+    return serializers
+
+_bulkWriterCache = {}
+
+def _writesBulk(cls):
+    bulk = _bulkWriterCache.get(cls)
+    if bulk == None:
+        bulk = (cls.bulkNumbers and cls.writeLong is HproseWriter.writeLong and
+                all((t not in _codecEncoders) and
+                    (getattr(cls, cls.serializers.get(t, ''), None) is getattr(HproseWriter, name))
+                    for (t, name) in ((int, 'writeInteger'), (float, 'writeDouble'), (bool, 'writeBoolean'))))
+        bulk = _bulkWriterCache.setdefault(cls, bulk)
+    return bulk
+
+def _fieldValues(fields):
+    if len(fields) == 0:
+        return lambda obj: ()
+    getter = attrgetter(*fields)
+    def values(obj):
+        try:
+            values = getter(obj)
+        except AttributeError:
+            return [getattr(obj, name, None) for name in fields]
+        return values if len(fields) > 1 else (values,)
+    return values
+
+_fieldAccessorCache = {}
+
+def _getFieldAccessor(cls):
+    if cls not in _fieldAccessorCache:
+        fields = _getObjectFields(cls)
+        if fields == None:
+            accessor = None
+        elif _isNamedTuple(cls):
+            accessor = (fields, tuple)
+        else:
+            accessor = (fields, _fieldValues(fields))
+        _fieldAccessorCache.setdefault(cls, accessor)
+    return _fieldAccessorCache[cls]
+
+_classHeaderCache = {}
+
+def _getClassHeader(cls, fields):
+    key = (cls, fields)
+    header = _classHeaderCache.get(key)
+    if header == None:
+        classname = HproseClassManager.getClassAlias(cls)
+        stream = HproseOutputBuffer()
+        count = len(fields)
+        stream.write(b'c%d"%s"' % (len(classname), classname.encode('utf-8')))
+        stream.write(b'%d{' % count if count > 0 else HproseTags.TagOpenbrace)
+        writer = HproseWriter(stream, True)
+        for name in fields: writer.writeString(name)
+        stream.write(HproseTags.TagClosebrace)
+        _classCacheLock.acquire()
+        try:
+            header = _classHeaderCache.setdefault(key, stream.getvalue())
+        finally:
+            _classCacheLock.release()
+    return header
+
 class HproseWriter(object):
-    def __init__(self, stream, simple = False):
+    serializers = {
+        type(None): '_HproseWriter__writeNone',
+        bool: 'writeBoolean',
+        int: 'writeInteger',
+        float: 'writeDouble',
+        decimal.Decimal: 'writeDouble',
+        bytes: 'writeBytesWithRef',
+        bytearray: 'writeBytesWithRef',
+        memoryview: 'writeBytesWithRef',
+        str: '_HproseWriter__writeStr',
+        UUID: 'writeGuidWithRef',
+        list: 'writeListWithRef',
+        tuple: 'writeListWithRef',
+        HproseLazyList: 'writeListWithRef',
+        dict_items: 'writeViewWithRef',
+        dict_keys: 'writeViewWithRef',
+        dict_values: 'writeViewWithRef',
+        dict: 'writeMapWithRef',
+        HproseLazyMap: 'writeMapWithRef',
+        set: 'writeIterableWithRef',
+        frozenset: 'writeIterableWithRef',
+        GeneratorType: 'writeIterableWithRef',
+        datetime.datetime: 'writeDateWithRef',
+        datetime.date: 'writeDateWithRef',
+        datetime.time: 'writeTimeWithRef',
+        object: 'writeObjectWithRef',
+    }
+    spoolSize = 1048576
+    bulkNumbers = True
+    def __init__(self, stream, simple = False, refer = None):
         self.stream = stream
         self.classref = {}
         self.fieldsref = []
-        self.refer = FakeWriterRefer() if simple else RealWriterRefer(stream)
+        if simple:
+            self.refer = FakeWriterRefer()
+        elif refer == None:
+            self.refer = RealWriterRefer(stream)
+        else:
+            self.refer = refer(stream)
+        self._serializers = _getSerializers(self.__class__)
+        self._bulk = _writesBulk(self.__class__)
+        self.__temps = []
     def serialize(self, v):
-        if v == None: self.writeNull()
-        elif isinstance(v, bool): self.writeBoolean(v)
-        elif isinstance(v, int): self.writeInteger(v)
-        elif isinstance(v, float): self.writeDouble(v)
-        elif isinstance(v, decimal.Decimal): self.writeDouble(v)
-        elif isinstance(v, (bytes, bytearray, memoryview)): self.writeBytesWithRef(v)
-        elif isinstance(v, str):
-            if v == '':
-                self.writeEmpty()
-            elif len(v) == 1:
-                self.writeUTF8Char(v)
+        t = type(v)
+        serializer = self._serializers.get(t)
+        if serializer == None:
+            serializer = self._getSerializer(t)
+        serializer(self, v)
+    def _getSerializer(self, t):
+        serializers = self.serializers
+        for cls in t.__mro__:
+            if cls in _codecEncoders:
+                serializer = _codecEncoders[cls]
+            elif cls is tuple and _isNamedTuple(t):
+                serializer = self.__class__.writeObjectWithRef
+            elif (cls is object and t.__dictoffset__ == 0 and (issubclass(t, Iterator) or
+                  issubclass(t, Iterable) and _getObjectFields(t) == None)):
+                serializer = self.__class__.writeIterableWithRef
+            elif cls in serializers:
+                serializer = getattr(self.__class__, serializers[cls])
             else:
-                self.writeStringWithRef(v)
-        elif isinstance(v, UUID): self.writeGuidWithRef(v)
-        elif isinstance(v, (list, tuple)): self.writeListWithRef(v)
-        elif isinstance(v, (dict_items, dict_keys, dict_values)): self.writeViewWithRef(v)
-        elif isinstance(v, dict): self.writeMapWithRef(v)
-        elif isinstance(v, (datetime.datetime, datetime.date)): self.writeDateWithRef(v)
-        elif isinstance(v, datetime.time): self.writeTimeWithRef(v)
-        elif isinstance(v, object): self.writeObjectWithRef(v)
-        else: raise HproseException('Not support to serialize this data')
+                continue
+            self._serializers[t] = serializer
+            return serializer
+        raise HproseException('Not support to serialize this data')
+    def __writeNone(self, v):
+        self.writeNull()
+    def __writeStr(self, s):
+        if s == '':
+            self.writeEmpty()
+        elif len(s) == 1 and s < '\U00010000':
+            self.writeUTF8Char(s)
+        else:
+            self.writeStringWithRef(s)
     def writeInteger(self, i):
-        if 0 <= i <= 9:
-            self.stream.write(str(i).encode('utf-8'))
+        if -128 <= i < 1024:
+            self.stream.write(_integers[i + 128])
         elif -2147483648 <= i <= 2147483647:
-            self.stream.write(HproseTags.TagInteger)
-            self.stream.write(str(i).encode('utf-8'))
-            self.stream.write(HproseTags.TagSemicolon)
+            self.stream.write(b'i%d;' % i)
         else:
             self.writeLong(i)
     def writeLong(self, l):
-        self.stream.write(HproseTags.TagLong)
-        self.stream.write(str(l).encode('utf-8'))
-        self.stream.write(HproseTags.TagSemicolon)
+        self.stream.write(b'l%d;' % l)
     def writeDouble(self, d):
         if isNaN(d): self.writeNaN()
         elif isInf(d): self.writeInfinity(isPosInf(d))
         else:
-            self.stream.write(HproseTags.TagDouble)
-            self.stream.write(str(d).encode('utf-8'))
-            self.stream.write(HproseTags.TagSemicolon)
+            self.stream.write(b'd%s;' % str(d).encode('utf-8'))
     def writeNaN(self):
         self.stream.write(HproseTags.TagNaN)
     def writeInfinity(self, positive = True):
-        self.stream.write(HproseTags.TagInfinity)
         if positive:
-            self.stream.write(HproseTags.TagPos)
+            self.stream.write(b'I+')
         else:
-            self.stream.write(HproseTags.TagNeg)
+            self.stream.write(b'I-')
     def writeNull(self):
         self.stream.write(HproseTags.TagNull)
     def writeEmpty(self):
@@ -685,160 +2282,508 @@ class HproseWriter(object):
     def writeDate(self, date):
         self.refer.set(date)
         if isinstance(date, datetime.datetime):
-            if (date.utcoffset() != ZERO) and (date.utcoffset() != None):
-                date = date.astimezone(utc)
-            if date.hour == 0 and date.minute == 0 and date.second == 0 and date.microsecond == 0:
-                fmt = '%c%s' % (str(HproseTags.TagDate, 'utf-8'), '%Y%m%d')
-            elif date.year == 1970 and date.month == 1 and date.day == 1:
-                fmt = '%c%s' % (str(HproseTags.TagTime, 'utf-8'), '%H%M%S')
+            tzinfo = date.tzinfo
+            if tzinfo == None:
+                end = HproseTags.TagSemicolon
+            elif tzinfo is utc:
+                end = HproseTags.TagUTC
             else:
-                fmt = '%c%s%c%s' % (str(HproseTags.TagDate, 'utf-8'), '%Y%m%d',
-                                       str(HproseTags.TagTime, 'utf-8'), '%H%M%S')
-            if date.microsecond > 0:
-                fmt = '%s%c%s' % (fmt, str(HproseTags.TagPoint, 'utf-8'), '%f')
-            if date.utcoffset() == ZERO:
-                fmt = '%s%c' % (fmt, str(HproseTags.TagUTC, 'utf-8'))
+                offset = date.utcoffset()
+                if offset == None:
+                    end = HproseTags.TagSemicolon
+                else:
+                    if offset != ZERO: date = date.astimezone(utc)
+                    end = HproseTags.TagUTC
+            microsecond = date.microsecond
+            if date.hour == 0 and date.minute == 0 and date.second == 0 and microsecond == 0:
+                self.stream.write(b'D%04d%02d%02d%s' % (date.year, date.month, date.day, end))
+                return
+            if date.year == 1970 and date.month == 1 and date.day == 1:
+                s = b'T%02d%02d%02d' % (date.hour, date.minute, date.second)
             else:
-                fmt = '%s%c' % (fmt, str(HproseTags.TagSemicolon, 'utf-8'))
+                s = b'D%04d%02d%02dT%02d%02d%02d' % (date.year, date.month, date.day,
+                                                     date.hour, date.minute, date.second)
+            if microsecond > 0:
+                self.stream.write(b'%s.%06d%s' % (s, microsecond, end))
+            else:
+                self.stream.write(s + end)
         else:
-            fmt = '%c%s%c' % (str(HproseTags.TagDate, 'utf-8'),
-                                 '%Y%m%d',
-                                 str(HproseTags.TagSemicolon, 'utf-8'))
-        self.stream.write(date.strftime(fmt).encode('utf-8'))
+            self.stream.write(b'D%04d%02d%02d;' % (date.year, date.month, date.day))
     def writeDateWithRef(self, date):
         if not self.refer.write(date): self.writeDate(date)
     def writeTime(self, time):
         self.refer.set(time)
-        fmt = '%c%s' % (str(HproseTags.TagTime, 'utf-8'), '%H%M%S')
+        tzinfo = time.tzinfo
+        if tzinfo is utc or (tzinfo != None and time.utcoffset() == ZERO):
+            end = HproseTags.TagUTC
+        else:
+            end = HproseTags.TagSemicolon
         if time.microsecond > 0:
-            fmt = '%s%c%s' % (fmt, str(HproseTags.TagPoint, 'utf-8'), '%f')
-        if time.utcoffset() == ZERO:
-            fmt = '%s%c' % (fmt, str(HproseTags.TagUTC, 'utf-8'))
+            self.stream.write(b'T%02d%02d%02d.%06d%s' % (time.hour, time.minute, time.second,
+                                                         time.microsecond, end))
         else:
-            fmt = '%s%c' % (fmt, str(HproseTags.TagSemicolon, 'utf-8'))
-        self.stream.write(time.strftime(fmt).encode('utf-8'))
+            self.stream.write(b'T%02d%02d%02d%s' % (time.hour, time.minute, time.second, end))
     def writeTimeWithRef(self, time):
         if not self.refer.write(time): self.writeTime(time)
     def writeBytes(self, b):
         self.refer.set(b)
         length = len(b)
-        self.stream.write(HproseTags.TagBytes)
-        if length > 0: self.stream.write(str(length).encode('utf-8'))
-        self.stream.write(HproseTags.TagQuote)
-        if length > 0: self.stream.write(b)
-        self.stream.write(HproseTags.TagQuote)
+        if length == 0:
+            self.stream.write(b'b""')
+        else:
+            self.stream.write(b'b%d"' % length)
+            writeSegment = getattr(self.stream, 'writeSegment', None)
+            if writeSegment == None:
+                self.stream.write(b)
+            else:
+                writeSegment(b)
+            self.stream.write(HproseTags.TagQuote)
     def writeBytesWithRef(self, b):
         if not self.refer.write(b): self.writeBytes(b)
     def writeUTF8Char(self, u):
-        self.stream.write(HproseTags.TagUTF8Char)
-        self.stream.write(u.encode('utf-8'))
+        self.stream.write(b'u%s' % u.encode('utf-8'))
     def writeString(self, s):
         self.refer.set(s)
         length = len(s)
         if length == 0:
-            self.stream.write(('%s%s%s' % (str(HproseTags.TagString, 'utf-8'),
-                                           str(HproseTags.TagQuote, 'utf-8'),
-                                           str(HproseTags.TagQuote, 'utf-8'))).encode('utf-8'))
-        else:
-            self.stream.write(('%s%d%s%s%s' % (str(HproseTags.TagString, 'utf-8'),
-                                               length,
-                                               str(HproseTags.TagQuote, 'utf-8'),
-                                               s,
-                                               str(HproseTags.TagQuote, 'utf-8'))).encode('utf-8'))
+            self.stream.write(b's""')
+        else:
+            b = s.encode('utf-8')
+            if len(b) != length: length = _utf16length(b)
+            self.stream.write(b's%d"%s"' % (length, b))
     def writeStringWithRef(self, s):
         if not self.refer.write(s): self.writeString(s)
     def writeGuid(self, guid):
         self.refer.set(guid)
-        self.stream.write(HproseTags.TagGuid)
-        self.stream.write(HproseTags.TagOpenbrace)
-        self.stream.write(str(guid).encode('utf-8'))
-        self.stream.write(HproseTags.TagClosebrace)
+        self.stream.write(b'g{%s}' % str(guid).encode('utf-8'))
     def writeGuidWithRef(self, guid):
         if not self.refer.write(guid): self.writeGuid(guid)
     def writeList(self, l):
         self.refer.set(l)
         count = len(l)
-        self.stream.write(HproseTags.TagList)
-        if count > 0: self.stream.write(str(count).encode('utf-8'))
-        self.stream.write(HproseTags.TagOpenbrace)
-        for i in range(count): self.serialize(l[i])
+        if count == 0:
+            self.stream.write(b'a{}')
+            return
+        self.stream.write(b'a%d{' % count)
+        bulk = _bulknumbers(l) if count >= 16 and self._bulk else None
+        if bulk == None:
+            serialize = self.serialize
+            for v in l: serialize(v)
+        else:
+            for chunk in bulk: self.stream.write(chunk)
         self.stream.write(HproseTags.TagClosebrace)
     def writeListWithRef(self, l):
         if not self.refer.write(l): self.writeList(l)
     def writeView(self, view):
         self.refer.set(view)
         count = len(view)
-        self.stream.write(HproseTags.TagList)
-        if count > 0: self.stream.write(str(count).encode('utf-8'))
-        self.stream.write(HproseTags.TagOpenbrace)
-        for v in view: self.serialize(v)
+        if count == 0:
+            self.stream.write(b'a{}')
+            return
+        self.stream.write(b'a%d{' % count)
+        serialize = self.serialize
+        for v in view: serialize(v)
         self.stream.write(HproseTags.TagClosebrace)
     def writeViewWithRef(self, view):
         if not self.refer.write(view): self.writeView(view)
     def writeMap(self, m):
         self.refer.set(m)
         count = len(m)
-        self.stream.write(HproseTags.TagMap)
-        if count > 0: self.stream.write(str(count).encode('utf-8'))
-        self.stream.write(HproseTags.TagOpenbrace)
+        if count == 0:
+            self.stream.write(b'm{}')
+            return
+        self.stream.write(b'm%d{' % count)
+        serialize = self.serialize
         for key in m:
-            self.serialize(key)
-            self.serialize(m[key])
+            serialize(key)
+            serialize(m[key])
         self.stream.write(HproseTags.TagClosebrace)
     def writeMapWithRef(self, m):
         if not self.refer.write(m): self.writeMap(m)
-    def writeObject(self, obj):
-        classname = HproseClassManager.getClassAlias(obj.__class__)
-        if classname in self.classref:
-            index = self.classref[classname]
-            fields = self.fieldsref[index]
+    def writeIterable(self, iterable):
+        if isinstance(iterable, Sized):
+            self.refer.set(iterable)
+            count = len(iterable)
+            if count == 0:
+                self.stream.write(b'a{}')
+                return
+            self.stream.write(b'a%d{' % count)
+            serialize = self.serialize
+            for v in iterable: serialize(v)
+            self.stream.write(HproseTags.TagClosebrace)
+            return
+        stream = self.stream
+        refer = self.refer
+        refer.set(iterable)
+        buf = HproseOutputBuffer()
+        retain = not isinstance(refer, FakeWriterRefer)
+        tracker = None
+        if retain and hasattr(refer, 'mark') and hasattr(refer, 'forget'):
+            tracker = _StreamWriterRefer(refer)
+        count = 0
+        spool = SpooledTemporaryFile(self.spoolSize)
+        try:
+            self.__redirect(buf)
+            if tracker != None: self.refer = tracker
+            try:
+                serialize = self.serialize
+                for v in iterable:
+                    if tracker == None:
+                        serialize(v)
+                        if retain: self.__temps.append(v)
+                    else:
+                        mark = refer.mark()
+                        serialize(v)
+                        leaves = tracker.leaves
+                        if leaves:
+                            refer.forget(mark, set(map(id, leaves)))
+                            self.__temps.extend(leaves)
+                            del leaves[:]
+                        else:
+                            refer.forget(mark)
+                    if len(buf) >= 65536:
+                        spool.write(buf)
+                        del buf[:]
+                    count += 1
+            finally:
+                self.refer = refer
+                self.__redirect(stream)
+            if count == 0:
+                stream.write(b'a{}')
+            else:
+                stream.write(b'a%d{' % count)
+                spool.seek(0)
+                copyfileobj(spool, stream)
+                stream.write(buf)
+                stream.write(HproseTags.TagClosebrace)
+        finally:
+            spool.close()
+    def writeIterableWithRef(self, iterable):
+        if not self.refer.write(iterable): self.writeIterable(iterable)
+    def __redirect(self, stream):
+        self.stream = stream
+        if hasattr(self.refer, 'stream'): self.refer.stream = stream
+    def writeNDArray(self, a):
+        if a.ndim == 0:
+            self.serialize(a.item())
+            return
+        if a.ndim == 1 and (a.dtype == numpy.uint8 or a.dtype.kind == 'V'):
+            data = a.tobytes()
+            self.__temps.append(data)
+            self.writeBytes(data)
+            return
+        self.refer.set(a)
+        count = len(a)
+        if count == 0:
+            self.stream.write(b'a{}')
+            return
+        self.stream.write(b'a%d{' % count)
+        tokens = _ndtokens(a) if a.ndim == 1 and self._bulk else None
+        if tokens == None:
+            items = list(a) if a.ndim > 1 else a.tolist()
+            self.__temps.append(items)
+            serialize = self.serialize
+            for v in items: serialize(v)
         else:
-            data = vars(obj)
-            fields = tuple(data.keys())
-            index = self.__writeClass(classname, fields)
-        self.stream.write(HproseTags.TagObject)
-        self.stream.write(str(index).encode('utf-8'))
-        self.stream.write(HproseTags.TagOpenbrace)
-        self.refer.set(obj)
-        data = vars(obj)
-        count = len(fields)
-        for i in range(count):
-            self.serialize(data[fields[i]])
+            for chunk in tokens: self.stream.write(chunk)
+        self.stream.write(HproseTags.TagClosebrace)
+    def writeNDArrayWithRef(self, a):
+        if not self.refer.write(a): self.writeNDArray(a)
+    def __writeNumPyScalar(self, v):
+        self.serialize(v.item())
+    def writeObject(self, obj):
+        serialize = self.serialize
+        for value in self._beginObject(obj): serialize(value)
         self.stream.write(HproseTags.TagClosebrace)
     def writeObjectWithRef(self, obj):
         if not self.refer.write(obj): self.writeObject(obj)
-    def __writeClass(self, classname, fields):
-        count = len(fields)
-        self.stream.write(HproseTags.TagClass)
-        self.stream.write(str(len(classname)).encode('utf-8'))
-        self.stream.write(HproseTags.TagQuote)
-        self.stream.write(classname.encode('utf-8'))
-        self.stream.write(HproseTags.TagQuote)
-        if count > 0: self.stream.write(str(count).encode('utf-8'))
-        self.stream.write(HproseTags.TagOpenbrace)
-        for i in range(count):
-            field = fields[i]
-            self.writeString(field)
+    def _beginObject(self, obj):
+        cls = obj.__class__
+        index = self.classref.get(cls)
+        accessor = _getFieldAccessor(cls)
+        if accessor == None:
+            data = vars(obj)
+            if index == None: index = self._writeClass(cls, tuple(data))
+            self.stream.write(b'o%d{' % index)
+            self.refer.set(obj)
+            return map(data.__getitem__, self.fieldsref[index])
+        (fields, values) = accessor
+        if index == None: index = self._writeClass(cls, fields)
+        self.stream.write(b'o%d{' % index)
+        self.refer.set(obj)
+        return iter(values(obj))
+    def writeEncodedObject(self, obj):
+        serialize = self.serialize
+        for value in self._beginEncodedObject(obj): serialize(value)
         self.stream.write(HproseTags.TagClosebrace)
+    def writeEncodedObjectWithRef(self, obj):
+        if not self.refer.write(obj): self.writeEncodedObject(obj)
+    def _beginEncodedObject(self, obj):
+        cls = obj.__class__
+        (fields, encode) = _getFieldAccessor(cls)
+        values = self.retain(encode(obj))
+        index = self.classref.get(cls)
+        if index == None: index = self._writeClass(cls, fields)
+        self.stream.write(b'o%d{' % index)
+        self.refer.set(obj)
+        return iter(values)
+    def retain(self, v):
+        self.__temps.append(v)
+        return v
+    def _writeClass(self, cls, fields):
+        self.stream.write(_getClassHeader(cls, fields))
+        refer = self.refer
+        for name in fields: refer.set(name)
         index = len(self.fieldsref)
         self.fieldsref.append(fields)
-        self.classref[classname] = index
+        self.classref[cls] = index
         return index
     def reset(self):
         self.classref.clear()
         del self.fieldsref[:]
+        del self.__temps[:]
         self.refer.reset()
 
+if numpy != None:
+    HproseWriter.serializers[numpy.ndarray] = 'writeNDArrayWithRef'
+    HproseWriter.serializers[numpy.generic] = '_HproseWriter__writeNumPyScalar'
+
+def _mapEntries(m):
+    for key in m:
+        yield key
+        yield m[key]
+
+_iterativeWriterCache = {}
+
+class HproseIterativeWriter(HproseWriter):
+    maxDepth = 262144
+    def __init__(self, stream, simple = False, refer = None):
+        super(HproseIterativeWriter, self).__init__(stream, simple, refer)
+        self.__containers = self.__getContainers(self.__class__)
+    def __getContainers(cls):
+        containers = _iterativeWriterCache.get(cls)
+        if containers == None:
+            containers = {}
+            for (name, begin) in (('List', '_HproseIterativeWriter__beginList'),
+                                  ('View', '_HproseIterativeWriter__beginView'),
+                                  ('Map', '_HproseIterativeWriter__beginMap'),
+                                  ('Object', '_beginObject'),
+                                  ('EncodedObject', '_beginEncodedObject')):
+                withRef = getattr(cls, 'write%sWithRef' % name)
+                if (withRef is getattr(HproseWriter, 'write%sWithRef' % name) and
+                    getattr(cls, 'write' + name) is getattr(HproseIterativeWriter, 'write' + name)):
+                    containers[withRef] = getattr(cls, begin)
+            containers = _iterativeWriterCache.setdefault(cls, containers)
+        return containers
+    __getContainers = staticmethod(__getContainers)
+    def serialize(self, v):
+        t = type(v)
+        serializer = self._serializers.get(t)
+        if serializer == None:
+            serializer = self._getSerializer(t)
+        begin = self.__containers.get(serializer)
+        if begin == None:
+            serializer(self, v)
+        elif not self.refer.write(v):
+            self.__run(begin(self, v))
+    def __run(self, values):
+        if values == None: return
+        serializers = self._serializers
+        getSerializer = self._getSerializer
+        containers = self.__containers
+        refer = self.refer
+        maxDepth = self.maxDepth
+        stack = []
+        while True:
+            for v in values:
+                t = type(v)
+                serializer = serializers.get(t)
+                if serializer == None: serializer = getSerializer(t)
+                if serializer not in containers:
+                    serializer(self, v)
+                elif not refer.write(v):
+                    children = containers[serializer](self, v)
+                    if children != None:
+                        if len(stack) >= maxDepth:
+                            raise HproseException('Nesting is too deep to serialize')
+                        stack.append(values)
+                        values = children
+                        break
+            else:
+                self.stream.write(HproseTags.TagClosebrace)
+                if len(stack) == 0: return
+                values = stack.pop()
+    def __beginList(self, l):
+        self.refer.set(l)
+        count = len(l)
+        if count == 0:
+            self.stream.write(b'a{}')
+            return None
+        self.stream.write(b'a%d{' % count)
+        bulk = _bulknumbers(l) if count >= 16 and self._bulk else None
+        if bulk == None: return iter(l)
+        for chunk in bulk: self.stream.write(chunk)
+        self.stream.write(HproseTags.TagClosebrace)
+        return None
+    def __beginView(self, view):
+        self.refer.set(view)
+        count = len(view)
+        if count == 0:
+            self.stream.write(b'a{}')
+            return None
+        self.stream.write(b'a%d{' % count)
+        return iter(view)
+    def __beginMap(self, m):
+        self.refer.set(m)
+        count = len(m)
+        if count == 0:
+            self.stream.write(b'm{}')
+            return None
+        self.stream.write(b'm%d{' % count)
+        if type(m) is dict: return chain.from_iterable(m.items())
+        return _mapEntries(m)
+    def writeList(self, l):
+        self.__run(self.__beginList(l))
+    def writeView(self, view):
+        self.__run(self.__beginView(view))
+    def writeMap(self, m):
+        self.__run(self.__beginMap(m))
+    def writeObject(self, obj):
+        self.__run(self._beginObject(obj))
+    def writeEncodedObject(self, obj):
+        self.__run(self._beginEncodedObject(obj))
+
+def _canonicalKey(key):
+    stream = HproseOutputBuffer()
+    HproseCanonicalWriter(stream, True).serialize(key)
+    return bytes(stream)
+
+def _sortedKeys(m):
+    keys = list(m)
+    types = set(map(type, keys))
+    if len(types) == 1 and (str in types or int in types):
+        keys.sort()
+    else:
+        keys.sort(key = _canonicalKey)
+    return keys
+
+_timeEpoch = datetime.date(2000, 1, 1)
+
+class HproseCanonicalWriter(HproseWriter):
+    bulkNumbers = False
+    def __init__(self, stream, simple = False):
+        super(HproseCanonicalWriter, self).__init__(stream, simple, CanonicalWriterRefer)
+    def writeDouble(self, d):
+        if d == 0: d = abs(d)
+        if isinstance(d, decimal.Decimal) and d.is_finite(): d = d.normalize()
+        super(HproseCanonicalWriter, self).writeDouble(d)
+    def writeTime(self, time):
+        tzinfo = time.tzinfo
+        if tzinfo != None and tzinfo is not utc:
+            offset = time.utcoffset()
+            if offset == None:
+                time = time.replace(tzinfo = None)
+            elif offset != ZERO:
+                time = (datetime.datetime.combine(_timeEpoch, time.replace(tzinfo = None)) - offset).time()
+                time = time.replace(tzinfo = utc)
+        super(HproseCanonicalWriter, self).writeTime(time)
+    def writeList(self, l):
+        super(HproseCanonicalWriter, self).writeList(l)
+        self.refer.release(l)
+    def writeView(self, view):
+        super(HproseCanonicalWriter, self).writeView(view)
+        self.refer.release(view)
+    def writeMap(self, m):
+        self.refer.set(m)
+        count = len(m)
+        if count == 0:
+            self.stream.write(b'm{}')
+        else:
+            self.stream.write(b'm%d{' % count)
+            serialize = self.serialize
+            for key in _sortedKeys(m):
+                serialize(key)
+                serialize(m[key])
+            self.stream.write(HproseTags.TagClosebrace)
+        self.refer.release(m)
+    def writeIterable(self, iterable):
+        if isinstance(iterable, (set, frozenset)):
+            self.writeList(_sortedKeys(iterable))
+        else:
+            super(HproseCanonicalWriter, self).writeIterable(iterable)
+            self.refer.release(iterable)
+    def writeNDArray(self, a):
+        super(HproseCanonicalWriter, self).writeNDArray(a)
+        self.refer.release(a)
+    def writeObject(self, obj):
+        cls = obj.__class__
+        if cls not in self.classref and _getFieldAccessor(cls) == None:
+            self._writeClass(cls, tuple(sorted(vars(obj))))
+        super(HproseCanonicalWriter, self).writeObject(obj)
+        self.refer.release(obj)
+    def writeEncodedObject(self, obj):
+        super(HproseCanonicalWriter, self).writeEncodedObject(obj)
+        self.refer.release(obj)
+
+class HproseCodecManager:
+    def registerEncoder(_type, encoder):
+        _classCacheLock.acquire()
+        try:
+            _codecEncoders[_type] = encoder
+            for serializers in _serializerCache.values(): serializers.clear()
+            _bulkWriterCache.clear()
+        finally:
+            _classCacheLock.release()
+    registerEncoder = staticmethod(registerEncoder)
+
+    def registerDecoder(alias, decoder, fields = None):
+        if fields != None: fields = tuple(fields)
+        _codecDecoders[alias] = (decoder, fields)
+    registerDecoder = staticmethod(registerDecoder)
+
+    def register(_type, alias, fields, encode, decode = None):
+        fields = tuple(fields)
+        HproseClassManager.register(_type, alias)
+        _fieldAccessorCache[_type] = (fields, encode)
+        HproseCodecManager.registerEncoder(_type, HproseWriter.writeEncodedObjectWithRef)
+        if decode != None:
+            HproseCodecManager.registerDecoder(alias, decode, fields)
+    register = staticmethod(register)
+
 class HproseFormatter:
-    def serialize(v, simple = False):
+    def serialize(v, simple = False, refer = None, iterative = False, canonical = False):
         stream = BytesIO()
-        writer = HproseWriter(stream, simple)
+        if canonical:
+            writer = HproseCanonicalWriter(stream, simple)
+        elif iterative:
+            writer = HproseIterativeWriter(stream, simple, refer)
+        else:
+            writer = HproseWriter(stream, simple, refer)
         writer.serialize(v)
         return stream.getvalue()
     serialize = staticmethod(serialize)
 
-    def unserialize(s, simple = False):
-        stream = BytesIO(s)
-        reader = HproseReader(stream, simple)
+    def serializeTo(v, sink, simple = False, refer = None, iterative = False, canonical = False, size = 65536):
+        stream = HproseStreamOutputBuffer(sink, size)
+        if canonical:
+            writer = HproseCanonicalWriter(stream, simple)
+        elif iterative:
+            writer = HproseIterativeWriter(stream, simple, refer)
+        else:
+            writer = HproseWriter(stream, simple, refer)
+        writer.serialize(v)
+        stream.close()
+        return len(stream)
+    serializeTo = staticmethod(serializeTo)
+
+    def unserialize(s, simple = False, refer = None, iterative = False):
+        if iterative:
+            reader = HproseIterativeReader(s, simple, refer = refer)
+        else:
+            reader = HproseBufferReader(s, simple, refer = refer)
         return reader.unserialize()
     unserialize = staticmethod(unserialize)
+
+    def digest(v, simple = False):
+        return blake2b(HproseFormatter.serialize(v, simple, canonical = True), digest_size = 16).hexdigest()
+    digest = staticmethod(digest)
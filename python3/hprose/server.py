@@ -11,17 +11,17 @@
 #                                                          #
 # hprose/server.py                                         #
 #                                                          #
-# hprose server for python 3.0+                            #
+# hprose server for python 3.7+                            #
 #                                                          #
-# LastModified: Mar 8, 2015                                #
+# LastModified: Oct 18, 2026                               #
 # Author: Ma Bingyao <andot@hprose.com>                    #
 #                                                          #
 ############################################################
 
 import types, traceback
-from io import BytesIO
 from sys import modules, exc_info
-from hprose.io import HproseTags, HproseWriter, HproseReader
+from io import BytesIO
+from hprose.io import HproseTags, HproseWriter, HproseBufferReader
 from hprose.common import HproseResultMode, HproseException
 
 def _getInstanceMethods(cls):
@@ -42,9 +42,11 @@ class HproseService(object):
         self.__funcNames = {}
         self.__resultMode = {}
         self.__simpleMode = {}
+        self.__referMode = {}
         self.__filters = []
         self.debug = False
         self.simple = False
+        self.refer = None
         self.onBeforeInvoke = None
         self.onAfterInvoke = None
         self.onSendHeader = None
@@ -79,9 +81,7 @@ class HproseService(object):
         return data
 
     def _responseEnd(self, ostream, context):
-        data = self.__outputFilter(ostream.getvalue(), context)
-        ostream.close()
-        return data
+        return self.__outputFilter(ostream.getvalue(), context)
 
     def _fixArgs(self, args, function, context):
         if hasattr(function, '__code__'):
@@ -147,23 +147,23 @@ class HproseService(object):
         ostream = BytesIO()
         writer = HproseWriter(ostream, True)
         ostream.write(HproseTags.TagError)
-        writer.writeString(str(e).encode('utf-8'))
+        writer.writeString(str(e))
         ostream.write(HproseTags.TagEnd)
         return self._responseEnd(ostream, context)
 
-    def _doInvoke(self, istream, context):
-        simpleReader = HproseReader(istream, True)
+    def _doInvoke(self, reader, context):
         tag = HproseTags.TagCall
         while tag == HproseTags.TagCall:
-            name = simpleReader.readString()
+            reader.reset()
+            name = reader.readString()
             aliasname = name.lower()
             args = []
             byref = False
-            tag = simpleReader.checkTags((HproseTags.TagList,
-                                          HproseTags.TagEnd,
-                                          HproseTags.TagCall))
+            tag = reader.checkTags((HproseTags.TagList,
+                                    HproseTags.TagEnd,
+                                    HproseTags.TagCall))
             if tag == HproseTags.TagList:
-                reader = HproseReader(istream)
+                reader.reset()
                 args = reader.readListWithoutTag()
                 tag = reader.checkTags((HproseTags.TagTrue,
                                         HproseTags.TagEnd,
@@ -177,11 +177,13 @@ class HproseService(object):
                 function = self.__functions[aliasname]
                 resultMode = self.__resultMode[aliasname]
                 simple = self.__simpleMode[aliasname]
+                refer = self.__referMode[aliasname]
                 result = function(*self._fixArgs(args, function, context))
             elif '*' in self.__functions:
                 function = self.__functions['*']
                 resultMode = self.__resultMode['*']
                 simple = self.__simpleMode['*']
+                refer = self.__referMode['*']
                 result = function(name, args)
             else:
                 raise HproseException("Can't find this function %s()." % name)
@@ -197,7 +199,8 @@ class HproseService(object):
                     ostream.write(result)
                 else:
                     if simple == None: simple = self.simple
-                    writer = HproseWriter(ostream, simple)
+                    if refer == None: refer = self.refer
+                    writer = HproseWriter(ostream, simple, refer)
                     writer.serialize(result)
                     if byref:
                         ostream.write(HproseTags.TagArgument)
@@ -215,15 +218,14 @@ class HproseService(object):
         return self._responseEnd(ostream, context)
 
     def _handle(self, data, context):
-        istream = None
         try:
             data = self.__inputFilter(data, context)
             if data == None or data == b'' or data[len(data) - 1:] != HproseTags.TagEnd:
                 raise HproseException("Wrong Request: \r\n%s" % str(data, 'utf-8'))
-            istream = BytesIO(data)
-            tag = istream.read(1)
+            reader = HproseBufferReader(data)
+            tag = reader.read(1)
             if tag == HproseTags.TagCall:
-                return self._doInvoke(istream, context)
+                return self._doInvoke(reader, context)
             elif tag == HproseTags.TagEnd:
                 return self._doFunctionList(context)
             else:
@@ -232,13 +234,11 @@ class HproseService(object):
             raise
         except Exception as e:
             return self._doError(e, context)
-        finally:
-            if istream != None: istream.close()
 
-    def addMissingFunction(self, function, resultMode = HproseResultMode.Normal, simple = None):
-        self.addFunction(function, '*', resultMode, simple)
+    def addMissingFunction(self, function, resultMode = HproseResultMode.Normal, simple = None, refer = None):
+        self.addFunction(function, '*', resultMode, simple, refer)
 
-    def addFunction(self, function, alias = None, resultMode = HproseResultMode.Normal, simple = None):
+    def addFunction(self, function, alias = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
         if isinstance(function, str):
             function = getattr(modules['__main__'], function, None)
         if not hasattr(function, '__call__'):
@@ -251,10 +251,11 @@ class HproseService(object):
             self.__funcNames[aliasname] = alias
             self.__resultMode[aliasname] = resultMode
             self.__simpleMode[aliasname] = simple
+            self.__referMode[aliasname] = refer
         else:
             raise HproseException('Argument alias is not a string')
 
-    def addFunctions(self, functions, aliases = None, resultMode = HproseResultMode.Normal, simple = None):
+    def addFunctions(self, functions, aliases = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
         aliases_is_null = (aliases == None)
         if not isinstance(functions, (list, tuple)):
             raise HproseException('Argument functions is not a list or tuple')
@@ -264,18 +265,18 @@ class HproseService(object):
         for i in range(count):
             function = functions[i]
             if aliases_is_null:
-                self.addFunction(function, None, resultMode, simple)
+                self.addFunction(function, None, resultMode, simple, refer)
             else:
-                self.addFunction(function, aliases[i], resultMode, simple)
+                self.addFunction(function, aliases[i], resultMode, simple, refer)
 
-    def addMethod(self, methodname, belongto, alias = None, resultMode = HproseResultMode.Normal, simple = None):
+    def addMethod(self, methodname, belongto, alias = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
         function = getattr(belongto, methodname, None)
         if alias == None:
-            self.addFunction(function, methodname, resultMode, simple)
+            self.addFunction(function, methodname, resultMode, simple, refer)
         else:
-            self.addFunction(function, alias, resultMode, simple)
+            self.addFunction(function, alias, resultMode, simple, refer)
 
-    def addMethods(self, methods, belongto, aliases = None, resultMode = HproseResultMode.Normal, simple = None):
+    def addMethods(self, methods, belongto, aliases = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
         aliases_is_null = (aliases == None)
         if not isinstance(methods, (list, tuple)):
             raise HproseException('Argument methods is not a list or tuple')
@@ -289,21 +290,21 @@ class HproseService(object):
             method = methods[i]
             function = getattr(belongto, method, None)
             if aliases_is_null:
-                self.addFunction(function, method, resultMode, simple)
+                self.addFunction(function, method, resultMode, simple, refer)
             else:
-                self.addFunction(function, aliases[i], resultMode, simple)
+                self.addFunction(function, aliases[i], resultMode, simple, refer)
 
-    def addInstanceMethods(self, obj, cls = None, aliasPrefix = None, resultMode = HproseResultMode.Normal, simple = None):
+    def addInstanceMethods(self, obj, cls = None, aliasPrefix = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
         if cls == None: cls = obj.__class__
-        self.addMethods(_getInstanceMethods(cls), obj, aliasPrefix, resultMode, simple)
+        self.addMethods(_getInstanceMethods(cls), obj, aliasPrefix, resultMode, simple, refer)
 
 
-    def addClassMethods(self, cls, execcls = None, aliasPrefix = None, resultMode = HproseResultMode.Normal, simple = None):
+    def addClassMethods(self, cls, execcls = None, aliasPrefix = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
         if execcls == None: execcls = cls
-        self.addMethods(_getClassMethods(cls), execcls, aliasPrefix, resultMode, simple)
+        self.addMethods(_getClassMethods(cls), execcls, aliasPrefix, resultMode, simple, refer)
 
-    def addStaticMethods(self, cls, aliasPrefix = None, resultMode = HproseResultMode.Normal, simple = None):
-        self.addMethods(_getStaticMethods(cls), cls, aliasPrefix, resultMode, simple)
+    def addStaticMethods(self, cls, aliasPrefix = None, resultMode = HproseResultMode.Normal, simple = None, refer = None):
+        self.addMethods(_getStaticMethods(cls), cls, aliasPrefix, resultMode, simple, refer)
 
     def add(self, *args):
         args_num = len(args)
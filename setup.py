@@ -4,6 +4,9 @@ if sys.version_info < (2, 3):
     print >> sys.stderr, 'error: python 2.3 or higher is required, you are using %s' %'.'.join([str(i) for i in sys.version_info])
 
     sys.exit(1)
+if (3, 0) <= sys.version_info < (3, 7):
+    sys.stderr.write('error: python 3.7 or higher is required, you are using %s\n' % '.'.join([str(i) for i in sys.version_info]))
+    sys.exit(1)
 
 args = dict(
     name = 'hprose',
@@ -37,11 +40,11 @@ args['classifiers'] = [
     'Programming Language :: Python :: 2.6',
     'Programming Language :: Python :: 2.7',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.0',
-    'Programming Language :: Python :: 3.1',
-    'Programming Language :: Python :: 3.2',
-    'Programming Language :: Python :: 3.3',
-    'Programming Language :: Python :: 3.4',
+    'Programming Language :: Python :: 3.7',
+    'Programming Language :: Python :: 3.8',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
     'License :: OSI Approved :: MIT License',
     'Topic :: Internet',
     'Topic :: Internet :: WWW/HTTP :: WSGI',